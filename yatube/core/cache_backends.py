@@ -0,0 +1,370 @@
+"""Двухуровневый кэш: LRU в памяти процесса перед общим кэшем.
+
+L1 - ограниченный по размеру и времени жизни словарь внутри процесса,
+L2 - любой бэкенд из settings.CACHES (файловый, БД, memcached, redis).
+Django создает экземпляр бэкенда на каждый поток, поэтому сам L1,
+его блокировка, поколение и статистика лежат в общем для потоков
+процесса хранилище с именем из LOCATION, как у LocMemCache.
+Каждое изменение существующего ключа в L2 (перезапись, удаление, incr)
+получает номер поколения из общего счетчика, а под этим номером в L2
+записывается список измененных ключей. Процессы сверяют счетчик не чаще
+раза в GENERATION_CHECK_INTERVAL секунд и убирают из своего L1 только
+перечисленные ключи, поэтому инвалидации доходят до всех воркеров с
+задержкой не больше этого интервала. Весь L1 сбрасывается, лишь если
+процесс отстал больше чем на MAX_LOG_GAP поколений или часть журнала
+уже истекла.
+
+Удаление отсутствующего ключа ничего не инвалидирует, а ключи с
+окончаниями из L2_ONLY_SUFFIXES (блокировки) живут только в L2.
+
+FileBasedCache - файловый кэш для L2 по умолчанию: общий для всех
+процессов сервера, в отличие от LocMemCache, и с атомарными add и incr,
+на которых держатся блокировки и счетчик поколений.
+"""
+import os
+import pickle
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends import filebased
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.files import locks
+from django.utils.functional import cached_property
+
+GENERATION_KEY = 'two_tier:generation'
+LOG_KEY = 'two_tier:invalidated:{}'
+# Сколько живет запись журнала и на сколько поколений процесс может
+# отстать, догоняя журнал, а не сбрасывая L1 целиком
+LOG_TIMEOUT = 300
+MAX_LOG_GAP = 1000
+LOG_ATTEMPTS = 5
+MISSING = object()
+
+
+class _Store:
+    """Состояние L1, общее для всех потоков процесса."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.generation = None
+        self.checked_at = 0
+        # Счетчик изменений L1: значение, прочитанное из L2 до
+        # параллельной записи, не должно попасть в L1 после нее
+        self.writes = 0
+        self.stats = Counter()
+
+
+_stores = {}
+_stores_lock = Lock()
+
+
+class TwoTierCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2_ALIAS', 'shared')
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        self._check_interval = float(
+            options.get('GENERATION_CHECK_INTERVAL', 1)
+        )
+        self._l2_only_suffixes = tuple(
+            options.get('L2_ONLY_SUFFIXES', (':lock',))
+        )
+        with _stores_lock:
+            self._store = _stores.setdefault(location, _Store())
+        self._l1 = self._store.entries
+        self._lock = self._store.lock
+        self._stats = self._store.stats
+
+    @cached_property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # Служебные методы L1
+
+    def _l1_expiry(self, timeout):
+        expiry = time.time() + self._l1_timeout
+        backend_expiry = self.get_backend_timeout(timeout)
+        if backend_expiry is not None:
+            expiry = min(expiry, backend_expiry)
+        return expiry
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return MISSING
+            pickled, expiry = entry
+            if expiry <= time.time():
+                del self._l1[key]
+                return MISSING
+            self._l1.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT, read_at=None):
+        """Кладет значение в L1. read_at - значение writes перед
+        чтением value из L2: если с тех пор L1 менялся, value может
+        быть устаревшим и не сохраняется."""
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        expiry = self._l1_expiry(timeout)
+        with self._lock:
+            if read_at is None:
+                self._store.writes += 1
+            elif read_at != self._store.writes:
+                return
+            self._l1[key] = (pickled, expiry)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+                self._stats['l1_evictions'] += 1
+
+    def _l1_delete(self, key):
+        with self._lock:
+            self._store.writes += 1
+            self._l1.pop(key, None)
+
+    def _l1_clear(self):
+        with self._lock:
+            self._store.writes += 1
+            self._l1.clear()
+
+    def _l2_only(self, key):
+        return key.endswith(self._l2_only_suffixes)
+
+    # Согласование поколений между процессами
+
+    def _sync_generation(self):
+        store = self._store
+        now = time.time()
+        with self._lock:
+            if now - store.checked_at < self._check_interval:
+                return
+            store.checked_at = now
+        generation = self.l2.get(GENERATION_KEY, 0)
+        if generation == store.generation:
+            return
+        if (
+            store.generation is None
+            or not 0 < generation - store.generation <= MAX_LOG_GAP
+            or not self._apply_log(store.generation + 1, generation)
+        ):
+            if store.generation is not None:
+                self._stats['l1_flushes'] += 1
+            self._l1_clear()
+        store.generation = generation
+
+    def _apply_log(self, first, last):
+        """Убирает из L1 ключи из журнала поколений first..last.
+
+        Возвращает False, если части журнала нет: тогда неизвестно,
+        какие ключи изменились.
+        """
+        log_keys = [LOG_KEY.format(n) for n in range(first, last + 1)]
+        log = self.l2.get_many(log_keys)
+        if len(log) < len(log_keys):
+            return False
+        with self._lock:
+            self._store.writes += 1
+            for keys in log.values():
+                for key in keys:
+                    if self._l1.pop(key, None) is not None:
+                        self._stats['l1_invalidations'] += 1
+        return True
+
+    def _invalidate(self, keys):
+        """Записывает в журнал поколений ключи, измененные в L2.
+
+        Номер поколения занимается через add, поэтому запись не теряется,
+        даже если incr в L2 не атомарен и два процесса получили один
+        номер: проигравший берет следующий.
+        """
+        if not keys:
+            return
+        for _ in range(LOG_ATTEMPTS):
+            try:
+                generation = self.l2.incr(GENERATION_KEY)
+            except ValueError:
+                self.l2.add(GENERATION_KEY, 0, None)
+                continue
+            if self.l2.add(LOG_KEY.format(generation), keys, LOG_TIMEOUT):
+                break
+        else:
+            # Журнал не записан: пусть остальные процессы сбросят L1
+            self.l2.set(GENERATION_KEY, 0, None)
+            return
+        store = self._store
+        with self._lock:
+            if store.generation is not None and (
+                generation == store.generation + 1
+            ):
+                # Своих записей из журнала применять не нужно
+                store.generation = generation
+
+    # Интерфейс BaseCache
+
+    def get(self, key, default=None, version=None):
+        if self._l2_only(key):
+            return self.l2.get(key, default, version)
+        self._sync_generation()
+        l1_key = self.make_key(key, version)
+        value = self._l1_get(l1_key)
+        if value is not MISSING:
+            self._stats['l1_hits'] += 1
+            return value
+        read_at = self._store.writes
+        value = self.l2.get(key, MISSING, version)
+        if value is MISSING:
+            self._stats['misses'] += 1
+            return default
+        self._stats['l2_hits'] += 1
+        self._l1_set(l1_key, value, read_at=read_at)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync_generation()
+        found = {}
+        missed = []
+        for key in keys:
+            value = self._l1_get(self.make_key(key, version))
+            if value is MISSING:
+                missed.append(key)
+            else:
+                found[key] = value
+        self._stats['l1_hits'] += len(found)
+        if missed:
+            read_at = self._store.writes
+            from_l2 = self.l2.get_many(missed, version=version)
+            self._stats['l2_hits'] += len(from_l2)
+            self._stats['misses'] += len(missed) - len(from_l2)
+            for key, value in from_l2.items():
+                if not self._l2_only(key):
+                    self._l1_set(
+                        self.make_key(key, version), value, read_at=read_at,
+                    )
+            found.update(from_l2)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._l2_only(key):
+            self.l2.set(key, value, timeout, version)
+            return
+        # Новый ключ не может лежать в L1 других процессов, поэтому
+        # инвалидируется только перезаписанный.
+        existed = self.l2.has_key(key, version)
+        self.l2.set(key, value, timeout, version)
+        l1_key = self.make_key(key, version)
+        if existed:
+            self._invalidate([l1_key])
+        self._l1_set(l1_key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        existed = self.l2.get_many(data.keys(), version=version)
+        failed = self.l2.set_many(data, timeout, version)
+        self._invalidate([
+            self.make_key(key, version) for key in existed
+            if not self._l2_only(key)
+        ])
+        for key, value in data.items():
+            if key not in failed and not self._l2_only(key):
+                self._l1_set(self.make_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added and not self._l2_only(key):
+            self._l1_set(self.make_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self.make_key(key, version))
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        if self._l2_only(key):
+            self.l2.delete(key, version)
+            return
+        l1_key = self.make_key(key, version)
+        self._l1_delete(l1_key)
+        existed = self.l2.has_key(key, version)
+        self.l2.delete(key, version)
+        if existed:
+            self._invalidate([l1_key])
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._l1_delete(self.make_key(key, version))
+        existed = self.l2.get_many(keys, version=version)
+        self.l2.delete_many(keys, version)
+        self._invalidate([
+            self.make_key(key, version) for key in existed
+            if not self._l2_only(key)
+        ])
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version) is not MISSING
+
+    def incr(self, key, delta=1, version=None):
+        if self._l2_only(key):
+            return self.l2.incr(key, delta, version)
+        l1_key = self.make_key(key, version)
+        self._l1_delete(l1_key)
+        value = self.l2.incr(key, delta, version)
+        self._invalidate([l1_key])
+        return value
+
+    def clear(self):
+        self._l1_clear()
+        self.l2.clear()
+        self._store.generation = None
+        self._store.checked_at = 0
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    def stats(self):
+        """Статистика попаданий всех потоков процесса в L1 и L2."""
+        stats = dict(self._stats)
+        lookups = sum(self._stats[name] for name in (
+            'l1_hits', 'l2_hits', 'misses',
+        ))
+        stats['l1_entries'] = len(self._l1)
+        stats['l1_hit_ratio'] = (
+            self._stats['l1_hits'] / lookups if lookups else 0.0
+        )
+        stats['l2_hit_ratio'] = (
+            self._stats['l2_hits'] / lookups if lookups else 0.0
+        )
+        return stats
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    """Файловый кэш, в котором add и incr выполняются под блокировкой
+    файла: у Django это пара чтение-запись, и два процесса могли
+    захватить одну блокировку или потерять увеличение счетчика."""
+    lock_name = 'cache.lock'
+
+    @contextmanager
+    def _locked(self):
+        self._createdir()
+        with open(os.path.join(self._dir, self.lock_name), 'ab') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(file)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked():
+            return super().incr(key, delta, version)
@@ -0,0 +1,150 @@
+"""Отдача файлов из MEDIA_ROOT.
+
+Если перед приложением стоит прокси, передача файла поручается ему
+заголовком X-Accel-Redirect (nginx) или X-Sendfile (Apache, lighttpd),
+см. MEDIA_OFFLOAD. Иначе файл отдается FileResponse: WSGI-сервер с
+wsgi.file_wrapper (gunicorn, uWSGI) передает его через sendfile без
+копирования в память процесса, в том числе для запросов с Range.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from core.storage import content_storage
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """Файл, из которого читается только length байт с позиции start.
+
+    fileno() оставлен, поэтому file_wrapper сервера отдает диапазон
+    через sendfile с текущей позиции и длиной из Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Границы (start, end) включительно из заголовка Range.
+
+    Возвращает None, если заголовка нет или в нем несколько диапазонов:
+    тогда отдается весь файл.
+    """
+    match = RANGE.match(header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _range_allowed(request, etag, last_modified):
+    """If-Range: диапазон отдается, только если файл не изменился."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and date >= last_modified
+
+
+def is_immutable(name):
+    """Миниатюры и картинки с хэшем содержимого в имени не меняются."""
+    return (
+        name.startswith(sorl_settings.THUMBNAIL_PREFIX)
+        or content_storage.is_content_addressed(name)
+    )
+
+
+def _cache_headers(response, name, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if is_immutable(name):
+        response['Cache-Control'] = (
+            f'public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+        )
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_MAX_AGE}'
+    return response
+
+
+def serve_file(request, path, name):
+    """Ответ с файлом path, доступным по имени name внутри MEDIA_ROOT."""
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified,
+    )
+    if response is not None:
+        return _cache_headers(response, name, etag, last_modified)
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    if settings.MEDIA_OFFLOAD:
+        # Прокси сам обработает Range и отдаст файл
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_OFFLOAD == 'nginx':
+            response['X-Accel-Redirect'] = quote(
+                settings.MEDIA_ACCEL_PREFIX + name,
+            )
+        else:
+            response['X-Sendfile'] = path
+        return _cache_headers(response, name, etag, last_modified)
+    size = stat.st_size
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return _cache_headers(response, name, etag, last_modified)
+    if byte_range is None or not _range_allowed(request, etag, last_modified):
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        return _cache_headers(response, name, etag, last_modified)
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(
+        FileRange(open(path, 'rb'), start, length),
+        status=206,
+        content_type=content_type,
+    )
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return _cache_headers(response, name, etag, last_modified)
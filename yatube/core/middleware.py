@@ -0,0 +1,116 @@
+import logging
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from core.queries import QueryBudgetExceeded, record_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого запроса и проверяет бюджет view.
+
+    Бюджет объявляется декоратором core.queries.query_budget.
+    Нарушения пишутся в лог, а при QUERY_BUDGET_STRICT = True
+    вызывают исключение QueryBudgetExceeded (используется в тестах).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        with record_queries() as request.query_log:
+            response = self.get_response(request)
+        problems = request.query_log.problems(request.query_budget)
+        if settings.DEBUG:
+            response['X-Query-Count'] = len(request.query_log)
+        if problems:
+            message = f'{request.path}: ' + '; '.join(problems)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+
+class StaticFilesMiddleware:
+    """Отдает собранную статику из STATIC_ROOT без вызова view.
+
+    Если клиент принимает br или gzip и collectstatic сохранил сжатую
+    копию файла, отдается она. Файлы с хэшем содержимого в имени из
+    манифеста кэшируются клиентами навсегда (immutable), остальные -
+    на STATIC_MAX_AGE секунд.
+    """
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.immutable = set(
+            getattr(staticfiles_storage, 'hashed_files', {}).values()
+        )
+
+    def __call__(self, request):
+        if (
+            request.method in ('GET', 'HEAD')
+            and request.path.startswith(self.prefix)
+        ):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        content_type, _ = mimetypes.guess_type(path)
+        accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        encoding = None
+        for candidate, suffix in self.encodings:
+            if (
+                re.search(rf'\b{candidate}\b', accept)
+                and os.path.isfile(path + suffix)
+            ):
+                path, encoding = path + suffix, candidate
+                break
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(stat.st_mtime),
+        )
+        if response is None:
+            response = FileResponse(
+                open(path, 'rb'),
+                content_type=content_type or 'application/octet-stream',
+            )
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if name in self.immutable:
+            response['Cache-Control'] = (
+                f'public, max-age={settings.STATIC_IMMUTABLE_MAX_AGE}, '
+                'immutable'
+            )
+        else:
+            response['Cache-Control'] = (
+                f'public, max-age={settings.STATIC_MAX_AGE}'
+            )
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
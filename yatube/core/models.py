@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class StoredFile(models.Model):
+    """Файл в хранилище с адресацией по содержимому и число ссылок
+    на него."""
+    name = models.CharField(
+        verbose_name='Имя файла',
+        max_length=255,
+        primary_key=True,
+    )
+    references = models.PositiveIntegerField(
+        verbose_name='Число ссылок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self):
+        return self.name
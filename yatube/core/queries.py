@@ -0,0 +1,77 @@
+"""Учет SQL-запросов, выполняемых при обработке запроса."""
+import re
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+
+class QueryBudgetExceeded(Exception):
+    """Страница выполнила больше запросов, чем ей разрешено."""
+
+
+def query_shape(sql):
+    """Приводит SQL к форме без конкретных значений."""
+    return NUMBER.sub('N', IN_LIST.sub('(%s...)', sql))
+
+
+def query_budget(limit):
+    """Декоратор: объявляет максимальное число запросов для view."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            return view_func(*args, **kwargs)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+class QueryLog:
+    """Обертка над выполнением запросов, запоминающая их SQL.
+
+    Подключается через connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=None):
+        """Формы запросов, повторившиеся не менее threshold раз (N+1)."""
+        if threshold is None:
+            threshold = settings.QUERY_N_PLUS_ONE_THRESHOLD
+        shapes = Counter(query_shape(sql) for sql in self.queries)
+        return {
+            shape: count for shape, count in shapes.items()
+            if count >= threshold
+        }
+
+    def problems(self, budget=None):
+        """Список нарушений: превышение бюджета и повторы запросов."""
+        problems = []
+        if budget is not None and len(self) > budget:
+            problems.append(
+                f'выполнено запросов: {len(self)}, бюджет: {budget}'
+            )
+        for shape, count in self.repeated().items():
+            problems.append(f'N+1 ({count} раз): {shape}')
+        return problems
+
+
+@contextmanager
+def record_queries():
+    """Контекст, записывающий все SQL-запросы в QueryLog."""
+    log = QueryLog()
+    with connection.execute_wrapper(log):
+        yield log
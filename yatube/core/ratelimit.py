@@ -0,0 +1,147 @@
+"""Ограничение частоты запросов алгоритмом token bucket.
+
+У каждого пользователя и каждого IP-адреса в своей области (scope) есть
+корзина на N токенов, которая пополняется со скоростью N за период, см.
+settings.RATE_LIMITS. Запрос забирает токен; если токенов нет, он
+получает 429 с заголовком Retry-After.
+
+Корзины хранятся в общем кэше settings.RATE_LIMIT_CACHE, минуя L1 в
+памяти процесса, чтобы лимит был общим для всех воркеров. Чтение и
+запись корзины выполняются под короткой блокировкой (cache.add), поэтому
+параллельные запросы не тратят один и тот же токен.
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 20
+LOCK_POLL_INTERVAL = 0.005
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60): размер корзины и период ее пополнения."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+
+def client_ip(request):
+    """IP клиента с учетом RATE_LIMIT_PROXY_COUNT доверенных прокси,
+    каждый из которых дописывает адрес в X-Forwarded-For."""
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    if proxies:
+        forwarded = [
+            ip.strip()
+            for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+            if ip.strip()
+        ]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _cache():
+    return caches[settings.RATE_LIMIT_CACHE]
+
+
+def take_token(key, rate):
+    """Забирает токен из корзины key.
+
+    Возвращает 0, если токен был, иначе число секунд до появления
+    следующего.
+    """
+    capacity, period = parse_rate(rate)
+    refill = capacity / period
+    cache = _cache()
+    lock_key = f'{key}:lock'
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            break
+        time.sleep(LOCK_POLL_INTERVAL)
+    else:
+        # Блокировку держит зависший запрос: лимит важнее не сломать сайт
+        return 0
+    try:
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        if tokens < 1:
+            return (1 - tokens) / refill
+        # Через period корзина наполнится, и запись больше не нужна
+        cache.set(key, (tokens - 1, now), period)
+        return 0
+    finally:
+        cache.delete(lock_key)
+
+
+def check_rate(request, scope):
+    """Проверяет лимиты области scope, возвращает секунды до повтора
+    или 0, если запрос можно выполнить."""
+    limits = settings.RATE_LIMITS.get(scope, {})
+    buckets = []
+    if 'ip' in limits:
+        buckets.append((f'ip:{client_ip(request)}', limits['ip']))
+    if 'user' in limits and request.user.is_authenticated:
+        buckets.append((f'user:{request.user.pk}', limits['user']))
+    for bucket, rate in buckets:
+        retry_after = take_token(f'ratelimit:{scope}:{bucket}', rate)
+        if retry_after:
+            return retry_after
+    return 0
+
+
+def _rejected_key(scope):
+    return f'ratelimit:rejected:{scope}'
+
+
+def count_rejected(scope):
+    cache = _cache()
+    key = _rejected_key(scope)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен между add и incr
+        cache.add(key, 1, None)
+
+
+def rejected_counts():
+    """Число отклоненных запросов по областям."""
+    keys = {_rejected_key(scope): scope for scope in settings.RATE_LIMITS}
+    counts = _cache().get_many(keys)
+    return {scope: counts.get(key, 0) for key, scope in keys.items()}
+
+
+def rate_limit(scope, methods=('POST',)):
+    """Декоратор: ограничивает частоту запросов methods к view.
+
+    Лимиты берутся из settings.RATE_LIMITS[scope]; превысивший их
+    клиент получает 429 с Retry-After.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                retry_after = check_rate(request, scope)
+                if retry_after:
+                    count_rejected(scope)
+                    logger.warning(
+                        'Превышен лимит %s: %s', scope, client_ip(request),
+                    )
+                    response = render(
+                        request, 'core/429.html', status=429,
+                    )
+                    response['Retry-After'] = math.ceil(retry_after)
+                    return response
+            return view_func(request, *args, **kwargs)
+        wrapper.rate_limit = scope
+        return wrapper
+    return decorator
@@ -0,0 +1,79 @@
+"""Защита от одновременного пересчета горячих ключей кэша.
+
+Значение хранится в конверте вместе с логическим сроком годности,
+версией и временем, которое заняло его вычисление. Запись в кэше
+живет дольше логического срока, чтобы было что отдать, пока значение
+пересчитывается:
+
+* пересчет выполняет только тот запрос, который захватил блокировку
+  (cache.add), остальные получают устаревшее значение. В блокировке
+  лежит случайный токен владельца, и снимает ее только владелец: если
+  блокировка истекла и ее взял другой запрос, она не удаляется;
+* незадолго до истечения срока запрос может с некоторой вероятностью
+  обновить значение заранее (алгоритм XFetch), чем дороже вычисление,
+  тем раньше.
+"""
+import math
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+POLL_INTERVAL = 0.05
+
+
+def _is_fresh(envelope, version, beta):
+    if envelope.get('version') != version:
+        return False
+    early = envelope['delta'] * beta * math.log(1 - random.random())
+    return time.time() - early < envelope['expires']
+
+
+def _release(lock_key, token):
+    # Проверка и удаление не атомарны, но чужая блокировка удаляется,
+    # только если она появилась между ними
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def get_or_compute(key, compute, timeout, version=None, beta=1.0):
+    """Возвращает значение из кэша, пересчитывая его один раз за истечение.
+
+    compute() вызывается без аргументов; если он вернул None, значение
+    не кэшируется. version - версия данных: конверт с другой версией
+    считается устаревшим, но может быть отдан, пока идет пересчет.
+    """
+    envelope = cache.get(key)
+    if envelope is not None and _is_fresh(envelope, version, beta):
+        return envelope['value']
+    lock_key = f'{key}:lock'
+    lock_timeout = settings.CACHE_LOCK_TIMEOUT
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, lock_timeout):
+        if envelope is not None:
+            return envelope['value']
+        # Холодный ключ: ждем, пока значение посчитает владелец
+        # блокировки. Если он упал или ничего не вернул, блокировка
+        # снимается (или истекает) и ее забирает один из ждущих.
+        while True:
+            time.sleep(POLL_INTERVAL)
+            envelope = cache.get(key)
+            if envelope is not None and envelope.get('version') == version:
+                return envelope['value']
+            if cache.add(lock_key, token, lock_timeout):
+                break
+    try:
+        started = time.time()
+        value = compute()
+        if value is not None:
+            cache.set(key, {
+                'value': value,
+                'version': version,
+                'expires': time.time() + timeout,
+                'delta': time.time() - started,
+            }, timeout + settings.CACHE_STALE_TIME)
+        return value
+    finally:
+        _release(lock_key, token)
@@ -0,0 +1,174 @@
+"""Файловые хранилища проекта.
+
+ContentAddressedStorage - хранилище картинок с адресацией по содержимому.
+
+Файл сохраняется под именем из SHA-256 его содержимого и раскладывается
+по вложенным каталогам из первых символов хэша:
+posts/ab/cd/abcd...ef.jpg. Одинаковые загрузки хранятся один раз, а
+StoredFile считает ссылки на файл: save() добавляет ссылку, delete()
+убирает ее и удаляет сам файл после фиксации транзакции, только когда
+ссылок не осталось. После удаления файла отправляется сигнал
+file_deleted, чтобы приложения убрали производные от него файлы.
+
+CompressedManifestStaticFilesStorage - статика с хэшем содержимого в
+имени и заранее сжатыми копиями .gz и .br (если установлен brotli),
+которые отдает core.middleware.StaticFilesMiddleware.
+"""
+import gzip
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+from core.models import StoredFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Файл без ссылок удален из ContentAddressedStorage
+file_deleted = Signal(providing_args=['name'])
+
+HASH_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+
+def content_hash(content):
+    """SHA-256 содержимого файла, читаемого по частям."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def is_content_addressed(self, name):
+        return bool(HASH_NAME.search(name))
+
+    def content_name(self, name, content):
+        """Имя файла по содержимому в каталоге исходного имени."""
+        digest = content_hash(content)
+        shards = [
+            digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+            for i in range(SHARD_DEPTH)
+        ]
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), *shards, digest + extension,
+        ).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if not self.exists(name):
+            try:
+                name = self._save(name, content)
+            except FileExistsError:
+                # Тот же файл успел записать параллельный запрос
+                pass
+        self.add_reference(name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # _save() при занятом имени просит новое: для имени из хэша это
+        # означает, что файл с тем же содержимым уже есть
+        if self.is_content_addressed(name) and self.exists(name):
+            raise FileExistsError(name)
+        return super().get_available_name(name, max_length)
+
+    def add_reference(self, name, count=1):
+        updated = StoredFile.objects.filter(name=name).update(
+            references=F('references') + count,
+        )
+        if not updated:
+            _, created = StoredFile.objects.get_or_create(
+                name=name, defaults={'references': count},
+            )
+            if not created:
+                self.add_reference(name, count)
+
+    def delete(self, name):
+        """Убирает ссылку на файл; файл без ссылок удаляется.
+
+        Файлы без записи в StoredFile не удаляются: на них могут
+        ссылаться записи, созданные в обход save().
+        """
+        StoredFile.objects.filter(name=name, references__gt=0).update(
+            references=F('references') - 1,
+        )
+        if StoredFile.objects.filter(name=name, references=0).delete()[0]:
+            transaction.on_commit(lambda: self.delete_unreferenced(name))
+
+    def delete_unreferenced(self, name):
+        """Удаляет файл, если на него нет ссылок. Пока транзакция
+        фиксировалась, файл могли загрузить снова."""
+        if not StoredFile.objects.filter(name=name).exists():
+            super().delete(name)
+            file_deleted.send(sender=self.__class__, name=name)
+
+
+content_storage = ContentAddressedStorage()
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico',
+)
+
+
+def static_compressors():
+    """Пары (расширение копии, функция сжатия) для статики."""
+    compressors = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        compressors.insert(0, ('.br', brotli.compress))
+    return compressors
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Файл, которого нет в манифесте (например, collectstatic еще не
+    # запускали), отдается по исходному имени, а не роняет шаблон.
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        """Сохраняет сжатые копии файла, если они меньше исходного."""
+        path = self.path(name)
+        if not os.path.isfile(path):
+            return
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < settings.STATIC_COMPRESS_MIN_SIZE:
+            return
+        for suffix, compress in static_compressors():
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
@@ -0,0 +1,42 @@
+from django import template
+from django.template.base import TemplateSyntaxError
+
+from core.stampede import get_or_compute
+
+register = template.Library()
+
+
+class StampedeCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, key, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.key = key
+        self.version = version
+
+    def render(self, context):
+        return get_or_compute(
+            f'template.stampede.{self.key.resolve(context)}',
+            lambda: self.nodelist.render(context),
+            int(self.timeout.resolve(context)),
+            version=self.version.resolve(context),
+        )
+
+
+@register.tag('stampede_cache')
+def do_stampede_cache(parser, token):
+    """Кэширует фрагмент шаблона с защитой от одновременного пересчета.
+
+    Использование: {% stampede_cache timeout key version %}...
+    {% endstampede_cache %}
+    """
+    nodelist = parser.parse(('endstampede_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) != 4:
+        raise TemplateSyntaxError(
+            f"'{bits[0]}' принимает timeout, key и version."
+        )
+    return StampedeCacheNode(
+        nodelist,
+        *(parser.compile_filter(bit) for bit in bits[1:]),
+    )
@@ -0,0 +1,123 @@
+from itertools import count
+from threading import Thread
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from core.cache_backends import TwoTierCache
+
+_workers = count()
+
+
+def make_worker_cache(**options):
+    """Отдельный экземпляр кэша со своим L1, как в другом воркере."""
+    options.setdefault('L2_ALIAS', 'shared')
+    options.setdefault('GENERATION_CHECK_INTERVAL', 0)
+    return TwoTierCache(f'worker-{next(_workers)}', {'OPTIONS': options})
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    """Тестирование двухуровневого кэша."""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.worker1 = make_worker_cache()
+        self.worker2 = make_worker_cache()
+
+    def test_second_read_is_served_from_l1(self):
+        """Повторное чтение не обращается к L2."""
+        self.worker1.set('key', 'value')
+        self.assertEqual(self.worker2.get('key'), 'value')
+        self.assertEqual(self.worker2.get('key'), 'value')
+        stats = self.worker2.stats()
+        self.assertEqual(stats['l2_hits'], 1)
+        self.assertEqual(stats['l1_hits'], 1)
+        self.assertEqual(stats['l1_hit_ratio'], 0.5)
+
+    def test_invalidation_reaches_other_workers(self):
+        """Перезапись и удаление ключа видны в L1 другого воркера."""
+        self.worker1.set('key', 'old')
+        self.assertEqual(self.worker2.get('key'), 'old')
+        self.worker1.set('key', 'new')
+        self.assertEqual(self.worker2.get('key'), 'new')
+        self.worker1.delete('key')
+        self.assertIsNone(self.worker2.get('key'))
+
+    def test_incr_reaches_other_workers(self):
+        """Увеличение счетчика видно в L1 другого воркера."""
+        self.worker1.set('counter', 1)
+        self.assertEqual(self.worker2.get('counter'), 1)
+        self.worker1.incr('counter')
+        self.assertEqual(self.worker2.get('counter'), 2)
+
+    def test_l1_is_bounded(self):
+        """L1 не хранит больше L1_MAX_ENTRIES записей."""
+        worker = make_worker_cache(L1_MAX_ENTRIES=2)
+        worker.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(worker.stats()['l1_entries'], 2)
+        self.assertEqual(worker.get_many(['a', 'b', 'c']), {
+            'a': 1, 'b': 2, 'c': 3,
+        })
+
+    def test_invalidation_is_per_key(self):
+        """Изменение одного ключа не вытесняет остальные из L1 других
+        воркеров, а удаление отсутствующего ключа ничего не меняет."""
+        self.worker1.set_many({'a': 1, 'b': 2})
+        self.worker2.get_many(['a', 'b'])
+        self.worker1.set('a', 10)
+        self.worker1.delete('missing')
+        self.assertEqual(self.worker2.get_many(['a', 'b']), {'a': 10, 'b': 2})
+        stats = self.worker2.stats()
+        self.assertEqual(stats['l1_hits'], 1)
+        self.assertEqual(stats['l1_invalidations'], 1)
+        self.assertNotIn('l1_flushes', stats)
+
+    def test_lock_keys_stay_in_l2(self):
+        """Блокировки не попадают в L1 и не порождают инвалидаций."""
+        self.worker2.set('key', 'value')
+        generation = caches['shared'].get('two_tier:generation')
+        self.assertTrue(self.worker1.add('key:lock', 1))
+        self.assertFalse(self.worker2.add('key:lock', 1))
+        self.worker1.delete('key:lock')
+        self.assertTrue(self.worker2.add('key:lock', 1))
+        self.assertEqual(self.worker1.stats()['l1_entries'], 0)
+        self.assertEqual(
+            caches['shared'].get('two_tier:generation'), generation,
+        )
+
+    def test_lost_log_flushes_l1(self):
+        """Если журнала инвалидаций нет, L1 сбрасывается целиком."""
+        self.worker1.set_many({'a': 1, 'b': 2})
+        self.worker2.get_many(['a', 'b'])
+        self.worker1.set('a', 10)
+        caches['shared'].delete_many([
+            f'two_tier:invalidated:{n}' for n in range(10)
+        ])
+        self.assertEqual(self.worker2.get('a'), 10)
+        self.assertEqual(self.worker2.stats()['l1_flushes'], 1)
+
+    def test_threads_share_l1(self):
+        """Экземпляры кэша в потоках одного процесса делят L1 и
+        статистику."""
+        cache = caches['default']
+        cache.clear()
+        # Первое чтение сверяет поколение и сбрасывает L1 процесса
+        cache.get('key')
+        cache.set('key', 'value')
+        l1_hits = cache.stats().get('l1_hits', 0)
+        seen = {}
+
+        def read():
+            thread_cache = caches['default']
+            seen['other_instance'] = thread_cache is not cache
+            seen['value'] = thread_cache.get('key')
+
+        thread = Thread(target=read)
+        thread.start()
+        thread.join()
+        self.assertEqual(
+            seen, {'other_instance': True, 'value': 'value'},
+        )
+        stats = cache.stats()
+        self.assertEqual(stats['l1_hits'], l1_hits + 1)
+        self.assertEqual(stats['l1_entries'], 1)
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import Client, TestCase, override_settings
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CONTENT = bytes(range(256)) * 4
+IMMUTABLE_NAME = 'cache/ab/cd/abcdef.jpg'
+MUTABLE_NAME = 'variants/photo_480.jpg'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ServeMediaTest(TestCase):
+    """Тестирование отдачи медиафайлов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in (IMMUTABLE_NAME, MUTABLE_NAME):
+            path = os.path.join(TEMP_MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.url = settings.MEDIA_URL + IMMUTABLE_NAME
+
+    def test_file_served_with_cache_headers(self):
+        """Миниатюра отдается целиком и кэшируется навсегда."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        response = self.client.get(settings.MEDIA_URL + MUTABLE_NAME)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_range_request(self):
+        """Запрос с Range получает только нужные байты."""
+        cases = {
+            'bytes=10-19': (10, 19),
+            'bytes=1000-': (1000, len(CONTENT) - 1),
+            'bytes=-5': (len(CONTENT) - 5, len(CONTENT) - 1),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(range=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    response['Content-Range'],
+                    f'bytes {start}-{end}/{len(CONTENT)}',
+                )
+                self.assertEqual(
+                    int(response['Content-Length']), end - start + 1,
+                )
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    CONTENT[start:end + 1],
+                )
+
+    def test_unsatisfiable_range(self):
+        """Диапазон за концом файла получает 416."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_stale_if_range_returns_whole_file(self):
+        """Если файл изменился после If-Range, отдается весь файл."""
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_request_returns_not_modified(self):
+        """Повторный запрос с ETag получает 304."""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(MEDIA_OFFLOAD='nginx')
+    def test_offload_to_nginx(self):
+        """С nginx передача файла поручается X-Accel-Redirect."""
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            settings.MEDIA_ACCEL_PREFIX + IMMUTABLE_NAME,
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_missing_and_outside_files_not_found(self):
+        """Несуществующие файлы и пути вне MEDIA_ROOT дают 404."""
+        for name in ('missing.jpg', '../manage.py'):
+            with self.subTest(name=name):
+                response = self.client.get(settings.MEDIA_URL + name)
+                self.assertEqual(response.status_code, 404)
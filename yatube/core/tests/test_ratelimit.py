@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.ratelimit import rejected_counts
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+LIMITS = {
+    'add_comment': {'user': '2/m', 'ip': '3/m'},
+    'signup': {'ip': '1/h'},
+}
+
+
+@override_settings(RATE_LIMITS=LIMITS)
+class RateLimitTest(TestCase):
+    """Тестирование ограничения частоты запросов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.url = reverse(
+            'posts:add_comment', kwargs={'post_id': cls.post.id},
+        )
+
+    def setUp(self):
+        caches[settings.RATE_LIMIT_CACHE].clear()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def tearDown(self):
+        # Корзины с маленькими лимитами не должны достаться другим тестам
+        caches[settings.RATE_LIMIT_CACHE].clear()
+
+    def comment(self, client=None, **extra):
+        return (client or self.client).post(
+            self.url, data={'text': 'Комментарий'}, **extra,
+        )
+
+    def test_user_bucket_rejects_with_retry_after(self):
+        """Сверх лимита пользователь получает 429 с Retry-After,
+        а отклонение учитывается в счетчике."""
+        for _ in range(2):
+            self.assertEqual(self.comment().status_code, 302)
+        response = self.comment()
+        self.assertEqual(response.status_code, 429)
+        self.assertTemplateUsed(response, 'core/429.html')
+        self.assertEqual(int(response['Retry-After']), 30)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(rejected_counts()['add_comment'], 1)
+
+    def test_bucket_refills_over_time(self):
+        """Корзина пополняется со временем."""
+        with mock.patch('core.ratelimit.time.time', return_value=1000.0):
+            for _ in range(2):
+                self.comment()
+            self.assertEqual(self.comment().status_code, 429)
+        with mock.patch('core.ratelimit.time.time', return_value=1030.0):
+            self.assertEqual(self.comment().status_code, 302)
+
+    def test_ip_bucket_shared_between_users(self):
+        """Лимит IP-адреса общий для всех его пользователей."""
+        other = Client()
+        other.force_login(User.objects.create(username='other'))
+        self.comment()
+        self.comment()
+        self.assertEqual(self.comment(other).status_code, 302)
+        self.assertEqual(self.comment(other).status_code, 429)
+        response = self.comment(other, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+
+    def test_signup_limited_by_ip(self):
+        """Регистрация ограничена по IP, просмотр формы - нет."""
+        url = reverse('users:signup')
+        data = {
+            'username': 'newbie',
+            'password1': 'Sl0zhnyi-parol',
+            'password2': 'Sl0zhnyi-parol',
+        }
+        self.assertEqual(Client().post(url, data).status_code, 302)
+        data['username'] = 'second'
+        self.assertEqual(Client().post(url, data).status_code, 429)
+        self.assertEqual(Client().get(url).status_code, 200)
@@ -0,0 +1,101 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from core.stampede import get_or_compute
+
+THREADS = 10
+# У каждого потока свой экземпляр кэша со своим L1, как у воркера:
+# записи других потоков должны быть видны сразу
+CACHES = copy.deepcopy(settings.CACHES)
+CACHES['default']['OPTIONS']['GENERATION_CHECK_INTERVAL'] = 0
+
+
+@override_settings(CACHES=CACHES)
+class StampedeTest(SimpleTestCase):
+    """Тестирование защиты от одновременного пересчета ключа."""
+
+    def setUp(self):
+        cache.clear()
+        self.computations = 0
+        self.lock = threading.Lock()
+
+    def slow_compute(self, value):
+        def compute():
+            with self.lock:
+                self.computations += 1
+            time.sleep(0.2)
+            return value
+        return compute
+
+    def run_concurrently(self, version):
+        results = []
+        barrier = threading.Barrier(THREADS)
+
+        def worker():
+            barrier.wait()
+            results.append(get_or_compute(
+                'hot-key', self.slow_compute(version), 60, version=version,
+            ))
+
+        threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_cold_key_is_computed_once(self):
+        """Холодный ключ считается один раз, остальные ждут результат."""
+        results = self.run_concurrently(version=1)
+        self.assertEqual(self.computations, 1)
+        self.assertEqual(results, [1] * THREADS)
+
+    def test_expired_key_is_recomputed_once(self):
+        """Устаревшее значение пересчитывается один раз, пока отдается
+        предыдущее."""
+        get_or_compute('hot-key', self.slow_compute(1), 60, version=1)
+        self.computations = 0
+        results = self.run_concurrently(version=2)
+        self.assertEqual(self.computations, 1)
+        self.assertEqual(set(results), {1, 2})
+        self.assertEqual(
+            get_or_compute('hot-key', self.slow_compute(3), 60, version=2),
+            2,
+        )
+
+    def test_waiters_take_over_after_owner_failure(self):
+        """Если владелец блокировки упал, холодный ключ сразу считает
+        один из ждущих, а не ждет истечения блокировки."""
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError
+
+        owner = threading.Thread(
+            target=self.assertRaises,
+            args=(ValueError, get_or_compute, 'hot-key', failing, 60),
+        )
+        owner.start()
+        started.wait()
+        begin = time.time()
+        value = get_or_compute('hot-key', self.slow_compute(1), 60)
+        owner.join()
+        self.assertEqual(value, 1)
+        self.assertLess(time.time() - begin, settings.CACHE_LOCK_TIMEOUT / 2)
+
+    def test_lock_is_released_only_by_owner(self):
+        """Чужая блокировка, взятая после истечения своей, не снимается."""
+        def compute():
+            # Блокировка истекла, и ее захватил другой запрос
+            cache.set('hot-key:lock', 'other')
+            return 1
+
+        get_or_compute('hot-key', compute, 60)
+        self.assertEqual(cache.get('hot-key:lock'), 'other')
@@ -0,0 +1,82 @@
+import gzip
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+
+STYLES = 'body { color: #000; }\n' * 100
+TEMP_STATIC_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_STATIC_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    STATIC_ROOT=TEMP_STATIC_ROOT,
+    STATICFILES_DIRS=[TEMP_STATIC_DIR],
+    STATICFILES_FINDERS=[
+        'django.contrib.staticfiles.finders.FileSystemFinder',
+    ],
+)
+class StaticFilesTest(TestCase):
+    """Тестирование сборки и раздачи статики."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_STATIC_DIR, 'css'))
+        with open(os.path.join(TEMP_STATIC_DIR, 'css', 'site.css'), 'w') as f:
+            f.write(STYLES)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_STATIC_DIR, ignore_errors=True)
+        shutil.rmtree(TEMP_STATIC_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        call_command('collectstatic', interactive=False, stdout=StringIO())
+        self.hashed_name = staticfiles_storage.stored_name('css/site.css')
+        self.client = Client()
+
+    def test_collectstatic_saves_hashed_compressed_files(self):
+        """collectstatic добавляет хэш в имя и сохраняет сжатую копию."""
+        self.assertRegex(self.hashed_name, r'^css/site\.[0-9a-f]{12}\.css$')
+        path = staticfiles_storage.path(self.hashed_name)
+        with gzip.open(path + '.gz', 'rt') as compressed:
+            self.assertEqual(compressed.read(), STYLES)
+
+    def test_hashed_file_served_compressed_and_immutable(self):
+        """Файл с хэшем отдается сжатым и кэшируется навсегда."""
+        response = self.client.get(
+            settings.STATIC_URL + self.hashed_name,
+            HTTP_ACCEPT_ENCODING='gzip, deflate',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(content.decode(), STYLES)
+
+    def test_unhashed_file_served_with_short_max_age(self):
+        """Файл без хэша в имени отдается без immutable и несжатым
+        клиенту без поддержки сжатия."""
+        response = self.client.get(settings.STATIC_URL + 'css/site.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(
+            response['Cache-Control'],
+            f'public, max-age={settings.STATIC_MAX_AGE}',
+        )
+
+    def test_conditional_request_returns_not_modified(self):
+        """Повторный запрос с ETag получает 304."""
+        url = settings.STATIC_URL + self.hashed_name
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
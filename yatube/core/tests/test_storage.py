@@ -0,0 +1,149 @@
+import hashlib
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage
+from posts import thumbnails
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TransactionTestCase):
+    """Тестирование хранилища с адресацией по содержимому."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.storage = ContentAddressedStorage()
+
+    def test_file_named_by_content_in_shards(self):
+        """Файл называется хэшем содержимого и лежит в подкаталогах."""
+        name = self.storage.save('posts/photo.JPG', ContentFile(b'data'))
+        digest = hashlib.sha256(b'data').hexdigest()
+        self.assertEqual(
+            name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg',
+        )
+        self.assertTrue(self.storage.is_content_addressed(name))
+
+    def test_identical_uploads_are_stored_once(self):
+        """Одинаковые файлы хранятся один раз и считают ссылки."""
+        first = self.storage.save('posts/a.jpg', ContentFile(b'same'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'same'))
+        self.assertEqual(first, second)
+        self.assertEqual(StoredFile.objects.get(name=first).references, 2)
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл удаляется только вместе с последней ссылкой."""
+        name = self.storage.save('posts/a.jpg', ContentFile(b'same'))
+        self.storage.save('posts/b.jpg', ContentFile(b'same'))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_parallel_upload_reuses_content_name(self):
+        """Если файл успел записать параллельный запрос, используется
+        то же имя из хэша, а не новое со случайным суффиксом."""
+        first = self.storage.save('posts/a.jpg', ContentFile(b'same'))
+        with mock.patch.object(
+            ContentAddressedStorage, 'exists', side_effect=[False, True],
+        ):
+            second = self.storage.save('posts/b.jpg', ContentFile(b'same'))
+        self.assertEqual(second, first)
+        self.assertEqual(StoredFile.objects.get(name=first).references, 2)
+
+    def test_reupload_to_same_post_keeps_one_reference(self):
+        """Повторная загрузка той же картинки в пост не копит ссылки."""
+        post = Post.objects.create(
+            author=User.objects.create(username='author'),
+            text='Пост',
+            image=SimpleUploadedFile('a.gif', SMALL_GIF, 'image/gif'),
+        )
+        post.image = SimpleUploadedFile('b.gif', SMALL_GIF, 'image/gif')
+        post.save()
+        self.assertEqual(
+            StoredFile.objects.get(name=post.image.name).references, 1,
+        )
+        post.delete()
+        self.assertFalse(self.storage.exists(post.image.name))
+
+    def test_variants_deleted_with_source_file(self):
+        """Копии для srcset удаляются вместе с последней ссылкой на
+        картинку, а не копятся после замены."""
+        post = Post.objects.create(
+            author=User.objects.create(username='author'),
+            text='Пост',
+            image=SimpleUploadedFile('a.gif', SMALL_GIF, 'image/gif'),
+        )
+        name = post.image.name
+        variants = thumbnails.build_variants(name)['variants']
+        self.assertTrue(variants)
+        post.image = SimpleUploadedFile(
+            'b.gif', SMALL_GIF.replace(b'\xFF' * 3, b'\x00' * 3),
+            'image/gif',
+        )
+        post.save()
+        for variant in variants:
+            with self.subTest(variant=variant['name']):
+                self.assertFalse(default_storage.exists(variant['name']))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MigrateMediaStorageTest(TransactionTestCase):
+    """Тестирование переноса картинок командой migrate_media_storage."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+
+    def test_command_moves_and_deduplicates_images(self):
+        """Старые картинки переносятся, одинаковые сливаются в одну."""
+        legacy = FileSystemStorage()
+        names = [
+            legacy.save('posts/first.gif', ContentFile(b'same')),
+            legacy.save('posts/second.gif', ContentFile(b'same')),
+        ]
+        for name in names + names:
+            Post.objects.create(author=self.author, text='Пост', image=name)
+        call_command('migrate_media_storage', batch_size=1, stdout=StringIO())
+        images = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(images), 1)
+        new_name = images.pop()
+        self.assertTrue(Post.image.field.storage.is_content_addressed(
+            new_name,
+        ))
+        self.assertEqual(StoredFile.objects.get(name=new_name).references, 4)
+        for name in names:
+            with self.subTest(name=name):
+                self.assertFalse(legacy.exists(name))
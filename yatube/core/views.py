@@ -1,6 +1,17 @@
+import os
 from http import HTTPStatus
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+from core.media import serve_file
+from core.ratelimit import rejected_counts
 
 
 def page_not_found(request, exception):
@@ -26,3 +37,28 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def cache_stats(request):
+    """Статистика попаданий в кэш текущего воркера."""
+    stats = getattr(cache, 'stats', None)
+    return JsonResponse(stats() if stats else {})
+
+
+@staff_member_required
+def rate_limit_stats(request):
+    """Число запросов, отклоненных ограничением частоты, по областям."""
+    return JsonResponse(rejected_counts())
+
+
+@require_safe
+def serve_media(request, path):
+    """Файл из MEDIA_ROOT: через прокси, sendfile или по частям (Range)."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    return serve_file(request, full_path, path)
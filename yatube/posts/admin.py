@@ -1,4 +1,9 @@
+from collections import defaultdict
+
+from django import forms
 from django.contrib import admin
+
+from . import follows
 from .models import Comment, Follow, Group, Post
 
 
@@ -9,6 +14,9 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_feed()
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
@@ -19,12 +27,46 @@ class GroupAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
 
 
+class FollowAdminForm(forms.ModelForm):
+    class Meta:
+        model = Follow
+        fields = ('user', 'author')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('user') == cleaned_data.get('author'):
+            raise forms.ValidationError('Нельзя подписаться на себя.')
+        return cleaned_data
+
+
 class FollowAdmin(admin.ModelAdmin):
+    """Подписки создаются и удаляются через posts.follows, который
+    обновляет ленты и счетчики; существующую подписку не редактируют."""
+    form = FollowAdminForm
     list_display = ('pk', 'user', 'author')
     search_fields = ('user', 'author',)
     list_filter = ('user', 'author',)
     empty_value_display = '-пусто-'
 
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        follows.follow(obj.user_id, [obj.author_id])
+        obj.pk = Follow.objects.values_list('pk', flat=True).get(
+            user_id=obj.user_id, author_id=obj.author_id,
+        )
+
+    def delete_model(self, request, obj):
+        follows.unfollow(obj.user_id, [obj.author_id])
+
+    def delete_queryset(self, request, queryset):
+        author_ids = defaultdict(list)
+        for user_id, author_id in queryset.values_list('user_id', 'author_id'):
+            author_ids[user_id].append(author_id)
+        for user_id, authors in author_ids.items():
+            follows.unfollow(user_id, authors)
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
@@ -0,0 +1,195 @@
+"""Версионированный JSON API только для чтения: ленты, посты, комментарии.
+
+Выборки те же, что у страниц posts (Post.objects.for_feed() и
+CursorPaginator), поэтому API не делает N+1-запросов. Поддерживаются
+курсорная паджинация (?after=/?before=, ?limit=), выбор полей
+(?fields=id,text) и сильный ETag по содержимому ответа.
+"""
+import hashlib
+import json
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from core.queries import query_budget
+from posts.models import Comment, Group, Post
+from posts.utils import CURSOR_AFTER, CURSOR_BEFORE, CursorPaginator
+
+User = get_user_model()
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+POST_FIELDS = {
+    'id': lambda post: post.id,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: _isoformat(post.pub_date),
+    'modified': lambda post: _isoformat(post.modified),
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': lambda post: post.image.url if post.image else None,
+    'image_width': lambda post: post.image_width,
+    'image_height': lambda post: post.image_height,
+    'comments_count': lambda post: post.comments_count,
+}
+
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.id,
+    'post': lambda comment: comment.post_id,
+    'author': lambda comment: comment.author.username,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: _isoformat(comment.created),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _json_response(request, data, status=200):
+    """Компактный JSON с сильным ETag по содержимому."""
+    content = json.dumps(
+        data, ensure_ascii=False, separators=(',', ':'),
+    ).encode()
+    etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+    if status == 200:
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+    response = HttpResponse(
+        content, content_type='application/json', status=status,
+    )
+    response['ETag'] = etag
+    return response
+
+
+def _error(request, message, status):
+    return _json_response(request, {'detail': message}, status)
+
+
+def _selected_fields(request, serializers):
+    """Поля из ?fields=, по умолчанию все."""
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(serializers)
+    fields = fields.split(',')
+    unknown = [field for field in fields if field not in serializers]
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def _serialize(obj, fields, serializers):
+    return {field: serializers[field](obj) for field in fields}
+
+
+def _page_size(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    if not 1 <= limit <= settings.API_MAX_PAGE_SIZE:
+        raise BadRequest(
+            f'limit должен быть от 1 до {settings.API_MAX_PAGE_SIZE}'
+        )
+    return limit
+
+
+def _page_url(request, param, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query.pop(CURSOR_AFTER, None)
+    query.pop(CURSOR_BEFORE, None)
+    query[param] = cursor
+    return f'{request.path}?{urlencode(sorted(query.items()))}'
+
+
+def _page(request, queryset, serializers, date_field='pub_date'):
+    """Страница выборки queryset в формате API."""
+    try:
+        fields = _selected_fields(request, serializers)
+        paginator = CursorPaginator(
+            queryset, _page_size(request), date_field=date_field,
+        )
+    except BadRequest as error:
+        return _error(request, str(error), 400)
+    page = paginator.get_cursor_page(
+        after=request.GET.get(CURSOR_AFTER),
+        before=request.GET.get(CURSOR_BEFORE),
+    )
+    return _json_response(request, {
+        'results': [
+            _serialize(obj, fields, serializers) for obj in page.object_list
+        ],
+        'next': _page_url(request, CURSOR_AFTER, paginator.next_cursor),
+        'previous': _page_url(
+            request, CURSOR_BEFORE, paginator.previous_cursor,
+        ),
+    })
+
+
+@query_budget(1)
+@require_safe
+def post_list(request):
+    """Лента главной страницы."""
+    return _page(request, Post.objects.for_feed(), POST_FIELDS)
+
+
+@query_budget(2)
+@require_safe
+def group_post_list(request, slug):
+    """Лента группы."""
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True,
+    ).first()
+    if group_id is None:
+        return _error(request, 'Группа не найдена', 404)
+    posts = Post.objects.for_feed().filter(group_id=group_id)
+    return _page(request, posts, POST_FIELDS)
+
+
+@query_budget(2)
+@require_safe
+def user_post_list(request, username):
+    """Лента автора."""
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True,
+    ).first()
+    if author_id is None:
+        return _error(request, 'Пользователь не найден', 404)
+    posts = Post.objects.for_feed().filter(author_id=author_id)
+    return _page(request, posts, POST_FIELDS)
+
+
+@query_budget(1)
+@require_safe
+def post_detail(request, post_id):
+    """Один пост."""
+    try:
+        fields = _selected_fields(request, POST_FIELDS)
+    except BadRequest as error:
+        return _error(request, str(error), 400)
+    post = Post.objects.for_feed().filter(id=post_id).first()
+    if post is None:
+        return _error(request, 'Пост не найден', 404)
+    return _json_response(request, _serialize(post, fields, POST_FIELDS))
+
+
+@query_budget(2)
+@require_safe
+def comment_list(request, post_id):
+    """Комментарии к посту, новые первыми."""
+    if not Post.objects.filter(id=post_id).exists():
+        return _error(request, 'Пост не найден', 404)
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author',
+    ).only('post', 'text', 'created', 'author__username')
+    return _page(request, comments, COMMENT_FIELDS, date_field='created')
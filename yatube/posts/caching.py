@@ -0,0 +1,155 @@
+"""Версионированный кэш лент и страниц.
+
+У каждой ленты есть версия в кэше: общая для главной страницы,
+своя для каждой группы, автора и поста. Изменение поста или
+комментария повышает версии затронутых лент, поэтому старые фрагменты
+больше не читаются и их можно хранить минутами, не опасаясь устаревших
+страниц. Версия - это время последнего изменения в микросекундах,
+поэтому она же служит значением Last-Modified.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from core.stampede import get_or_compute
+
+INDEX_SCOPE = 'index'
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def group_scope(group_id):
+    if group_id is None:
+        return None
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def post_card_key(post):
+    """Ключ карточки поста меняется при каждом сохранении поста."""
+    return f'post_card:{post.pk}:{post.modified.timestamp()}'
+
+
+def _version_key(scope):
+    return f'feed_version:{scope}'
+
+
+def _now_version():
+    # Версия растет с течением времени, поэтому после вытеснения ключа
+    # из кэша не совпадет ни с одной из уже выданных.
+    return time.time_ns() // 1000
+
+
+def get_feed_version(scope):
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        version = _now_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_feed_version(*scopes):
+    """Повышает версии лент, после чего их кэш считается устаревшим."""
+    now = _now_version()
+    for scope in filter(None, scopes):
+        key = _version_key(scope)
+        version = cache.get(key) or 0
+        cache.set(key, max(now, version + 1), None)
+
+
+def get_feed_cache_key(request, scope):
+    """Ключ кэша страницы ленты: лента и позиция страницы."""
+    position = ':'.join(request.GET.get(name, '') for name in PAGE_PARAMS)
+    return f'{scope}:{position}'
+
+
+def get_feed_cache_context(request, scope):
+    """Переменные шаблона для {% stampede_cache %} ленты."""
+    return {
+        'feed_cache_key': get_feed_cache_key(request, scope),
+        'feed_version': get_feed_version(scope),
+        'feed_cache_time': settings.FEED_CACHE_TIME,
+    }
+
+
+def _cached_page(request, render, etag, last_modified):
+    """Ответ из кэша страниц; пока страница пересчитывается другим
+    запросом, отдается предыдущая версия со своими валидаторами."""
+    rendered = {}
+
+    def render_page():
+        response = rendered['response'] = render()
+        if response.status_code != 200:
+            return None
+        return (
+            response.content, response['Content-Type'], etag, last_modified,
+        )
+
+    cached = get_or_compute(
+        f'page:{request.get_full_path()}',
+        render_page,
+        settings.FEED_CACHE_TIME,
+        version=etag,
+    )
+    if cached is None:
+        return rendered['response']
+    content, content_type, etag, last_modified = cached
+    response = rendered.get('response') or HttpResponse(content, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def cache_anonymous_page(get_scopes):
+    """Кэширует страницу целиком для анонимных посетителей.
+
+    get_scopes получает аргументы view и возвращает ленты, от которых
+    зависит страница, или None, если страницу кэшировать нельзя.
+    ETag и Last-Modified строятся из версий этих лент, поэтому
+    повторный запрос получает 304 без рендеринга и запросов ленты.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+            ):
+                return view_func(request, *args, **kwargs)
+            scopes = get_scopes(*args, **kwargs)
+            if scopes is None:
+                return view_func(request, *args, **kwargs)
+            versions = [get_feed_version(scope) for scope in scopes]
+            signature = ':'.join(
+                [request.get_full_path()] + [str(v) for v in versions]
+            )
+            etag = quote_etag(hashlib.md5(signature.encode()).hexdigest())
+            last_modified = max(versions) // 1000000
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified,
+            )
+            if response is not None:
+                return response
+            return _cached_page(
+                request,
+                lambda: view_func(request, *args, **kwargs),
+                etag,
+                last_modified,
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,67 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются атомарно через F()-выражения, а reconcile()
+пересчитывает их из исходных таблиц одним UPDATE на счетчик.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Follow, Group, Post, Profile
+
+User = get_user_model()
+
+
+def increment(model, pk, field, delta=1):
+    """Атомарно изменяет счетчик одной записи, не опуская его ниже нуля."""
+    if pk is None:
+        return 0
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    return rows.update(**{field: F(field) + delta})
+
+
+def count_of(model, field):
+    """Подзапрос с количеством записей model, ссылающихся на строку."""
+    rows = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(rows), 0)
+
+
+def reconcile(users=None, posts=None, groups=None):
+    """Пересчитывает счетчики, возвращает число обновленных строк.
+
+    Без аргументов пересчитывается все; иначе только счетчики
+    переданных id пользователей, постов и групп.
+    """
+    everything = users is None and posts is None and groups is None
+    updated = 0
+    if everything or users is not None:
+        missing = User.objects.filter(profile__isnull=True)
+        profiles = Profile.objects.all()
+        if users is not None:
+            missing = missing.filter(pk__in=users)
+            profiles = profiles.filter(pk__in=users)
+        Profile.objects.bulk_create(
+            [Profile(user_id=pk)
+             for pk in missing.values_list('pk', flat=True)],
+            ignore_conflicts=True,
+        )
+        updated += profiles.update(
+            posts_count=count_of(Post, 'author'),
+            followers_count=count_of(Follow, 'author'),
+            following_count=count_of(Follow, 'user'),
+        )
+    if everything or posts is not None:
+        rows = Post.objects.all() if posts is None else Post.objects.filter(
+            pk__in=posts,
+        )
+        updated += rows.update(comments_count=count_of(Comment, 'post'))
+    if everything or groups is not None:
+        rows = Group.objects.all() if groups is None else Group.objects.filter(
+            pk__in=groups,
+        )
+        updated += rows.update(posts_count=count_of(Post, 'group'))
+    return updated
@@ -0,0 +1,79 @@
+"""Подписка на авторов и отписка пачкой.
+
+Только этот модуль создает и удаляет подписки: у Follow нет сигналов,
+поэтому ленту подписок и счетчики обновляют здесь же, а админка и
+удаление пользователя вызывают эти же функции.
+
+Подписки вставляются одним INSERT с игнорированием конфликтов
+(ON CONFLICT DO NOTHING на PostgreSQL и SQLite), поэтому повторный или
+параллельный запрос не падает на ограничении unigue_subscriber.
+Счетчики пересчитываются из таблицы Follow: так они верны, даже если
+часть подписок уже существовала. Отписка удаляет подписки одним DELETE
+и чистит ленту одним запросом на всю пачку авторов.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+
+from posts import counters, timeline
+from posts.caching import author_scope, bump_feed_version
+from posts.models import Follow
+
+User = get_user_model()
+
+
+def resolve_authors(usernames):
+    """Словарь username -> id для существующих пользователей."""
+    return dict(User.objects.filter(
+        username__in=usernames,
+    ).values_list('username', 'id'))
+
+
+def follow(user_id, author_ids):
+    """Подписывает пользователя на авторов; повторная подписка и
+    подписка на себя игнорируются."""
+    author_ids = set(author_ids) - {user_id}
+    if not author_ids:
+        return
+    with transaction.atomic():
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for author_id in author_ids],
+            ignore_conflicts=True,
+        )
+        timeline.backfill(user_id, *author_ids)
+        counters.reconcile(users=[user_id, *author_ids])
+    # Число подписчиков выводится на закэшированных страницах авторов
+    bump_feed_version(*(author_scope(author_id) for author_id in author_ids))
+
+
+def unfollow(user_id, author_ids):
+    """Отписывает пользователя от авторов."""
+    author_ids = set(author_ids)
+    if not author_ids:
+        return
+    with transaction.atomic():
+        follows = Follow.objects.filter(
+            user_id=user_id, author_id__in=author_ids,
+        )
+        follows.delete()
+        timeline.trim(user_id, *author_ids)
+        counters.reconcile(users=[user_id, *author_ids])
+    bump_feed_version(*(author_scope(author_id) for author_id in author_ids))
+
+
+def forget(user_id):
+    """Удаляет все подписки пользователя и на него перед удалением
+    самого пользователя, пересчитывая счетчики остальных."""
+    with transaction.atomic():
+        follows = Follow.objects.filter(
+            Q(user_id=user_id) | Q(author_id=user_id),
+        )
+        others = {
+            other_id
+            for pair in follows.values_list('user_id', 'author_id')
+            for other_id in pair
+        } - {user_id}
+        follows.delete()
+        counters.reconcile(users=others)
+    bump_feed_version(*(author_scope(other_id) for other_id in others))
@@ -1,6 +1,12 @@
+import logging
+
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
 from .models import Comment, Post
+from .uploads import normalize_image
+
+logger = logging.getLogger(__name__)
 
 
 class PostForm(forms.ModelForm):
@@ -9,6 +15,23 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        """Новая картинка уменьшается и пересохраняется без метаданных."""
+        image = self.cleaned_data.get('image')
+        self.image_bytes_saved = 0
+        if not isinstance(image, UploadedFile):
+            return image
+        upload = image
+        image, self.image_bytes_saved = normalize_image(upload)
+        if image is upload:
+            logger.info('Картинка %s сохранена без изменений', image.name)
+        else:
+            logger.info(
+                'Картинка %s нормализована: %d -> %d байт',
+                image.name, upload.size, image.size,
+            )
+        return image
+
 
 class CommentForm(forms.ModelForm):
 
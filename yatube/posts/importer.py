@@ -0,0 +1,378 @@
+"""Массовый импорт групп, постов, комментариев и подписок.
+
+Записи читаются потоком и вставляются пачками. Авторы, группы и посты
+ищутся через словари в памяти, а недостающие пользователи и группы
+создаются одним запросом на пачку. На PostgreSQL посты и комментарии
+загружаются через COPY FROM с заранее выделенными из последовательности
+id, на остальных СУБД - через bulk_create. Каждая пачка фиксируется в
+одной транзакции вместе с позицией в ImportCheckpoint, поэтому после
+сбоя импорт продолжается с первой незафиксированной записи.
+
+bulk_create не вызывает сигналы, которые ведут счетчики и ленты
+подписок, поэтому в той же транзакции пересчитываются счетчики
+затронутых пачкой пользователей, постов и групп, а новые посты и
+подписки добавляются только в ленты их подписчиков.
+
+Формат записи (JSONL или CSV с колонкой type):
+    group:   slug, title, description
+    post:    id (внешний, для ссылок из комментариев), author, group,
+             text, pub_date
+    comment: post (внешний id поста), author, text, created
+    follow:  user, author
+"""
+import csv
+import io
+import json
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, timeline
+from posts.caching import (INDEX_SCOPE, author_scope, bump_feed_version,
+                           group_scope)
+from posts.models import (Comment, Follow, Group, ImportCheckpoint,
+                          ImportedPost, Post, Profile)
+
+User = get_user_model()
+
+RECORD_TYPES = ('group', 'post', 'comment', 'follow')
+
+
+def read_records(file, fmt):
+    """Записи файла по одной, не читая файл целиком."""
+    if fmt == 'csv':
+        for row in csv.DictReader(file):
+            yield {key: value for key, value in row.items() if value}
+        return
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Неверная дата: {value}')
+    if settings.USE_TZ and timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def _copy_value(field, obj):
+    value = field.get_db_prep_save(getattr(obj, field.attname), connection)
+    if value is None:
+        return '\\N'
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def copy_objects(model, objs):
+    """Вставляет объекты с заданными id одним COPY FROM (PostgreSQL)."""
+    fields = model._meta.concrete_fields
+    buffer = io.StringIO()
+    for obj in objs:
+        buffer.write('\t'.join(_copy_value(field, obj) for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN',
+            buffer,
+        )
+
+
+def reserve_ids(model, count):
+    """Выделяет id для count новых строк.
+
+    На PostgreSQL id берутся из последовательности таблицы, на остальных
+    СУБД - после текущего максимума, поэтому там импорт нельзя запускать
+    одновременно с другими записями в эти таблицы.
+    """
+    if not count:
+        return []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                'FROM generate_series(1, %s)',
+                [model._meta.db_table, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    start = (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    return list(range(start, start + count))
+
+
+class Importer:
+    """Импорт одного источника с сохранением позиции после каждой пачки."""
+
+    def __init__(self, source, batch_size=None, use_copy=True,
+                 update_derived=True):
+        self.checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            source=source,
+        )
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.update_derived = update_derived
+        self.users = {}
+        self.groups = {}
+        self.posts = {}
+        self.scopes = {INDEX_SCOPE}
+        self.stats = Counter()
+
+    def restart(self):
+        self.checkpoint.position = 0
+        self.checkpoint.save(update_fields=['position', 'updated'])
+
+    def run(self, records):
+        """Импортирует записи после сохраненной позиции, после каждой
+        пачки отдает число записей в ней."""
+        records = islice(records, self.checkpoint.position, None)
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                return
+            self.import_batch(batch)
+            yield len(batch)
+
+    def import_batch(self, records):
+        by_type = defaultdict(list)
+        for record in records:
+            if record.get('type') in RECORD_TYPES:
+                by_type[record['type']].append(record)
+            else:
+                self.stats['skipped'] += 1
+        self.touched = defaultdict(set)
+        self.new_posts = []
+        with transaction.atomic():
+            self.import_groups(by_type['group'])
+            self.resolve_users(
+                {record.get('author') for record in records}
+                | {record.get('user') for record in by_type['follow']}
+            )
+            self.resolve_groups(
+                {record.get('group') for record in by_type['post']}
+            )
+            self.import_posts(by_type['post'])
+            self.import_comments(by_type['comment'])
+            self.import_follows(by_type['follow'])
+            if self.update_derived:
+                self.update_counters_and_timelines()
+            self.checkpoint.position += len(records)
+            self.checkpoint.save(update_fields=['position', 'updated'])
+
+    def insert(self, model, objs, dated_fields):
+        """Вставляет объекты с уже выделенными id.
+
+        bulk_create подставляет текущее время в поля auto_now_add,
+        поэтому исходные даты возвращаются вторым запросом bulk_update.
+        """
+        if self.use_copy:
+            copy_objects(model, objs)
+            return
+        dates = [[getattr(obj, field) for field in dated_fields]
+                 for obj in objs]
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        for obj, values in zip(objs, dates):
+            for field, value in zip(dated_fields, values):
+                setattr(obj, field, value)
+        model.objects.bulk_update(
+            objs, dated_fields, batch_size=self.batch_size,
+        )
+
+    def resolve_users(self, usernames):
+        missing = {name for name in usernames if name} - self.users.keys()
+        if not missing:
+            return
+        self.users.update(User.objects.filter(
+            username__in=missing,
+        ).values_list('username', 'id'))
+        new = missing - self.users.keys()
+        if not new:
+            return
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=name, password=password) for name in sorted(new)],
+            batch_size=self.batch_size,
+        )
+        created = dict(User.objects.filter(
+            username__in=new,
+        ).values_list('username', 'id'))
+        Profile.objects.bulk_create(
+            [Profile(user_id=user_id) for user_id in created.values()],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        self.users.update(created)
+        self.stats['users'] += len(created)
+
+    def resolve_groups(self, slugs):
+        missing = {slug for slug in slugs if slug} - self.groups.keys()
+        if missing:
+            self.import_groups([{'slug': slug} for slug in sorted(missing)])
+
+    def import_groups(self, records):
+        records = {record['slug']: record for record in records
+                   if record.get('slug')}
+        if not records:
+            return
+        self.groups.update(Group.objects.filter(
+            slug__in=records,
+        ).values_list('slug', 'id'))
+        new = [record for slug, record in records.items()
+               if slug not in self.groups]
+        Group.objects.bulk_create([
+            Group(
+                slug=record['slug'],
+                title=record.get('title', record['slug']),
+                description=record.get('description', ''),
+            )
+            for record in new
+        ], batch_size=self.batch_size)
+        self.groups.update(Group.objects.filter(
+            slug__in=[record['slug'] for record in new],
+        ).values_list('slug', 'id'))
+        self.stats['groups'] += len(new)
+
+    def resolve_posts(self, source_ids):
+        missing = {source_id for source_id in source_ids
+                   if source_id} - self.posts.keys()
+        if missing:
+            self.posts.update(ImportedPost.objects.filter(
+                source_id__in=missing,
+            ).values_list('source_id', 'post_id'))
+
+    def import_posts(self, records):
+        source_ids = [str(record['id']) for record in records
+                      if record.get('id') is not None]
+        self.resolve_posts(source_ids)
+        posts = []
+        sources = []
+        for record in records:
+            source_id = record.get('id')
+            source_id = None if source_id is None else str(source_id)
+            author_id = self.users.get(record.get('author'))
+            if (
+                author_id is None or not record.get('text')
+                or source_id in self.posts
+            ):
+                self.stats['skipped'] += 1
+                continue
+            pub_date = parse_date(record.get('pub_date'))
+            group_id = self.groups.get(record.get('group'))
+            posts.append(Post(
+                author_id=author_id,
+                group_id=group_id,
+                text=record['text'],
+                pub_date=pub_date,
+                modified=pub_date,
+            ))
+            sources.append(source_id)
+            if source_id is not None:
+                # Повтор внешнего id внутри пачки тоже пропускается
+                self.posts[source_id] = None
+            self.scopes.update({author_scope(author_id),
+                                group_scope(group_id)})
+        for post, post_id in zip(posts, reserve_ids(Post, len(posts))):
+            post.id = post_id
+            self.new_posts.append((post.id, post.author_id, post.pub_date))
+            self.touched['users'].add(post.author_id)
+            if post.group_id is not None:
+                self.touched['groups'].add(post.group_id)
+        self.insert(Post, posts, ['pub_date', 'modified'])
+        imported = [
+            ImportedPost(source_id=source_id, post_id=post.id)
+            for source_id, post in zip(sources, posts) if source_id
+        ]
+        ImportedPost.objects.bulk_create(imported, batch_size=self.batch_size)
+        self.posts.update((item.source_id, item.post_id) for item in imported)
+        self.stats['posts'] += len(posts)
+
+    def import_comments(self, records):
+        self.resolve_posts(str(record.get('post')) for record in records)
+        comments = []
+        for record in records:
+            post_id = self.posts.get(str(record.get('post')))
+            author_id = self.users.get(record.get('author'))
+            if post_id is None or author_id is None or not record.get('text'):
+                self.stats['skipped'] += 1
+                continue
+            comments.append(Comment(
+                post_id=post_id,
+                author_id=author_id,
+                text=record['text'],
+                created=parse_date(record.get('created')),
+            ))
+        # При повторном чтении файла (--restart) комментарии уже есть
+        existing = set(Comment.objects.filter(
+            post_id__in={comment.post_id for comment in comments},
+            created__in={comment.created for comment in comments},
+        ).values_list('post_id', 'author_id', 'created'))
+        new = []
+        for comment in comments:
+            key = (comment.post_id, comment.author_id, comment.created)
+            if key in existing:
+                self.stats['skipped'] += 1
+                continue
+            existing.add(key)
+            new.append(comment)
+        comments = new
+        ids = reserve_ids(Comment, len(comments))
+        for comment, comment_id in zip(comments, ids):
+            comment.id = comment_id
+            self.touched['posts'].add(comment.post_id)
+        self.insert(Comment, comments, ['created'])
+        self.stats['comments'] += len(comments)
+
+    def import_follows(self, records):
+        follows = set()
+        for record in records:
+            user_id = self.users.get(record.get('user'))
+            author_id = self.users.get(record.get('author'))
+            if user_id is None or author_id is None or user_id == author_id:
+                self.stats['skipped'] += 1
+                continue
+            follows.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            [Follow(user_id=user, author_id=author)
+             for user, author in follows],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        for user_id, author_id in follows:
+            self.touched['users'].update((user_id, author_id))
+            self.touched['follows'].add((user_id, author_id))
+        self.stats['follows'] += len(follows)
+
+    def update_counters_and_timelines(self):
+        """Пересчитывает счетчики и ленты, затронутые пачкой."""
+        counters.reconcile(
+            users=self.touched['users'],
+            posts=self.touched['posts'],
+            groups=self.touched['groups'],
+        )
+        timeline.fan_out_many(self.new_posts)
+        # Повторная подписка из файла не дублирует записи ленты
+        authors = defaultdict(list)
+        for user_id, author_id in self.touched['follows']:
+            authors[user_id].append(author_id)
+        for user_id, author_ids in authors.items():
+            timeline.backfill(user_id, *author_ids)
+
+    def finish(self):
+        """Сбрасывает кэш затронутых лент."""
+        bump_feed_version(*self.scopes)
@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def describe(name):
+    """Выполняется в дочернем процессе: без обращений к БД."""
+    try:
+        with Post.image.field.storage.open(name) as file:
+            return name, thumbnails.describe_image(file)
+    except (OSError, SuspiciousFileOperation):
+        return name, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры и превью картинок постов, обрабатывая '
+        'картинки в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько картинок записывать в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        names = sorted(set(
+            Post.objects.exclude(image='').filter(
+                image_placeholder='',
+            ).values_list('image', flat=True).iterator()
+        ))
+        batch_size = options['batch_size']
+        if options['workers'] > 1:
+            with ProcessPoolExecutor(options['workers']) as executor:
+                results = executor.map(describe, names, chunksize=16)
+                updated, failed = self.save(results, batch_size)
+        else:
+            updated, failed = self.save(map(describe, names), batch_size)
+        for name in failed:
+            self.stderr.write(f'Не удалось прочитать картинку: {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Превью построены, обработано картинок: {updated}'
+        ))
+
+    def save(self, results, batch_size):
+        updated = 0
+        failed = []
+        batch = []
+        for name, description in results:
+            if description is None:
+                failed.append(name)
+                continue
+            batch.append((name, description))
+            if len(batch) >= batch_size:
+                updated += self.save_batch(batch)
+                batch = []
+        return updated + self.save_batch(batch), failed
+
+    def save_batch(self, batch):
+        # Новый modified сбрасывает закэшированные карточки постов
+        with transaction.atomic():
+            for name, (width, height, placeholder) in batch:
+                Post.objects.filter(image=name).update(
+                    image_width=width,
+                    image_height=height,
+                    image_placeholder=placeholder,
+                    modified=timezone.now(),
+                )
+        return len(batch)
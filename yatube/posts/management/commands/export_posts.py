@@ -0,0 +1,54 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.exporter import (FORMATS, TABLES, gzip_stream, iter_lines,
+                            iter_records)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в сжатый gzip '
+        'JSONL или CSV, читая таблицы частями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл выгрузки, "-" - стандартный вывод.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='jsonl',
+            help='Формат записей.',
+        )
+        parser.add_argument(
+            '--tables',
+            nargs='+',
+            choices=list(TABLES),
+            help='Выгрузить только эти типы записей.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.EXPORT_CHUNK_SIZE,
+            help='Сколько строк читать из БД за раз.',
+        )
+
+    def handle(self, *args, **options):
+        records = iter_records(options['tables'], options['chunk_size'])
+        chunks = gzip_stream(iter_lines(records, options['format']))
+        if options['path'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            return
+        written = 0
+        with open(options['path'], 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгрузка сохранена, размер: {written} байт'
+        ))
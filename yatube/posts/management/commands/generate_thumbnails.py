@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def generate(name):
+    """Строит миниатюры одной картинки, возвращает ошибку или None:
+    сбой одной картинки не прерывает обработку остальных."""
+    try:
+        thumbnails.generate(name)
+    except Exception as error:
+        return name, error
+    return name, None
+
+
+def generate_in_thread(name):
+    try:
+        return generate(name)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит недостающие миниатюры и копии картинок постов '
+        'в несколько потоков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число потоков генерации.',
+        )
+
+    def handle(self, *args, **options):
+        images = Post.objects.exclude(image='').values_list(
+            'image', 'image_variants',
+        ).order_by('image')
+        missing = sorted({
+            name for name, variants in images.iterator()
+            if not variants or not thumbnails.is_ready(name)
+        })
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as executor:
+                results = list(executor.map(generate_in_thread, missing))
+        else:
+            results = [generate(name) for name in missing]
+        failed = [(name, error) for name, error in results if error]
+        for name, error in failed:
+            self.stderr.write(
+                f'Не удалось построить миниатюры {name}: {error}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Миниатюры построены, обработано картинок: '
+            f'{len(results) - len(failed)}'
+        ))
@@ -0,0 +1,88 @@
+import gzip
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import Importer, read_records
+
+FORMATS = ('jsonl', 'csv')
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует группы, посты, комментарии и подписки из JSONL или '
+        'CSV пачками. Прерванный импорт продолжается с последней '
+        'сохраненной пачки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл, можно сжатый gzip.')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.IMPORT_BATCH_SIZE,
+            help='Сколько записей вставлять в одной транзакции.',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY FROM на PostgreSQL.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать файл сначала, а не с сохраненной позиции.',
+        )
+        parser.add_argument(
+            '--skip-rebuild',
+            action='store_true',
+            help=(
+                'Не обновлять счетчики и ленты подписок, затронутые '
+                'импортом (потом запустите reconcile_counters и '
+                'rebuild_timelines).'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        name = path[:-3] if path.endswith('.gz') else path
+        fmt = options['format'] or os.path.splitext(name)[1].lstrip('.')
+        if fmt not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        importer = Importer(
+            os.path.abspath(path),
+            batch_size=options['batch_size'],
+            use_copy=not options['no_copy'],
+            update_derived=not options['skip_rebuild'],
+        )
+        if options['restart']:
+            importer.restart()
+        elif importer.checkpoint.position:
+            self.stdout.write(
+                f'Продолжение с записи {importer.checkpoint.position}'
+            )
+        opener = gzip.open if path.endswith('.gz') else open
+        started = time.monotonic()
+        total = 0
+        with opener(path, 'rt', encoding='utf-8', newline='') as file:
+            for count in importer.run(read_records(file, fmt)):
+                total += count
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'Импортировано записей: {total} '
+                    f'({total / elapsed:.0f} в секунду)'
+                )
+        importer.finish()
+        summary = ', '.join(
+            f'{key}: {value}' for key, value in sorted(importer.stats.items())
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершен, записей: {total}. {summary}'
+        ))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.caching import (INDEX_SCOPE, author_scope, bump_feed_version,
+                           group_scope, post_scope)
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище с адресацией по '
+        'содержимому и переписывает Post.image пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько картинок переносить в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post.image.field.storage
+        names = [
+            name for name in Post.objects.exclude(image='').values_list(
+                'image', flat=True,
+            ).distinct().order_by('image').iterator()
+            if not storage.is_content_addressed(name)
+        ]
+        batch_size = options['batch_size']
+        moved = 0
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            with transaction.atomic():
+                for old_name in batch:
+                    moved += self.move(storage, old_name)
+            self.stdout.write(f'Перенесено картинок: {moved}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Хранилище обновлено, перенесено картинок: {moved}'
+        ))
+
+    def move(self, storage, old_name):
+        if not storage.exists(old_name):
+            self.stderr.write(f'Файл не найден: {old_name}')
+            return 0
+        with storage.open(old_name) as content:
+            new_name = storage.save(old_name, content)
+        posts = Post.objects.filter(image=old_name)
+        rows = list(posts.values_list('id', 'author_id', 'group_id'))
+        # save() уже добавил одну ссылку, остальные - по числу постов
+        if len(rows) > 1:
+            storage.add_reference(new_name, len(rows) - 1)
+        posts.update(image=new_name, modified=timezone.now())
+        scopes = [INDEX_SCOPE]
+        for post_id, author_id, group_id in rows:
+            scopes += [
+                post_scope(post_id), author_scope(author_id),
+                group_scope(group_id),
+            ]
+        bump_feed_version(*scopes)
+        transaction.on_commit(lambda: storage.delete_unreferenced(old_name))
+        return 1
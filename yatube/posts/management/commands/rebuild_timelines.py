@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок (Timeline) из таблицы Follow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames',
+            nargs='*',
+            help='Пересобрать ленты только этих пользователей.',
+        )
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        with transaction.atomic():
+            count = timeline.rebuild(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, обработано подписок: {count}'
+        ))
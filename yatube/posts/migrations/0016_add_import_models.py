@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_add_post_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Источник')),
+                ('position', models.BigIntegerField(default=0, verbose_name='Импортировано записей')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportedPost',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_id', models.CharField(max_length=64, unique=True, verbose_name='Внешний идентификатор')),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='import_source', to='posts.Post', verbose_name='Пост')),
+            ],
+        ),
+    ]
@@ -1,7 +1,11 @@
+import json
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import content_storage
+
 User = get_user_model()
 
 
@@ -17,11 +21,45 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание группы',
     )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self) -> str:
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    """QuerySet постов с выборками для лент."""
+
+    FEED_FIELDS = (
+        'text',
+        'pub_date',
+        'modified',
+        'image',
+        'image_variants',
+        'image_width',
+        'image_height',
+        'image_placeholder',
+        'comments_count',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+        'group__slug',
+        'group__title',
+    )
+
+    def for_feed(self):
+        """Посты с автором и группой одним запросом.
+
+        Загружаются только поля, которые выводят шаблоны лент;
+        число комментариев берется из счетчика comments_count.
+        """
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+
 class Post(models.Model):
     """Модель, описывающая посты."""
     text = models.TextField(
@@ -31,6 +69,10 @@ class Post(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    modified = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -48,10 +90,54 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True,
     )
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        editable=False,
+        help_text='JSON с размерами и форматами копий картинки',
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        editable=False,
+    )
+    image_placeholder = models.TextField(
+        'Превью картинки',
+        blank=True,
+        editable=False,
+        help_text='Размытое превью картинки в виде data URI',
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx',
+            ),
+        ]
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
@@ -59,6 +145,26 @@ class Post(models.Model):
     def __str__(self):
         return self.text[:settings.FIRST_CHARACTERS]
 
+    @property
+    def image_sources(self):
+        """Наборы srcset копий картинки по форматам, от самого
+        компактного. Копии старой картинки не возвращаются."""
+        if not self.image or not self.image_variants:
+            return []
+        data = json.loads(self.image_variants)
+        if data.get('source') != self.image.name:
+            return []
+        sources = {}
+        for variant in data['variants']:
+            url = self.image.storage.url(variant['name'])
+            sources.setdefault(variant['type'], []).append(
+                f'{url} {variant["width"]}w'
+            )
+        return [
+            {'type': mime, 'srcset': ', '.join(srcset)}
+            for mime, srcset in sources.items()
+        ]
+
 
 class Comment(models.Model):
     """Модель, описывающая комментарии."""
@@ -83,6 +189,12 @@ class Comment(models.Model):
     )
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created_idx',
+            ),
+        ]
         ordering = ['-created']
 
     def __str__(self):
@@ -111,4 +223,108 @@ class Follow(models.Model):
                 name='unigue_subscriber'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx',
+            ),
+        ]
         ordering = ['-author']
+
+
+class Profile(models.Model):
+    """Модель со счетчиками пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='profile',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок',
+        default=0,
+    )
+
+    def __str__(self):
+        return str(self.user)
+
+
+class Timeline(models.Model):
+    """Модель ленты подписок: запись о посте для каждого подписчика."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx',
+            )
+        ]
+        ordering = ['-pub_date']
+
+
+class ImportCheckpoint(models.Model):
+    """Позиция, до которой импортирован файл командой import_posts."""
+    source = models.CharField(
+        verbose_name='Источник',
+        max_length=255,
+        unique=True,
+    )
+    position = models.BigIntegerField(
+        verbose_name='Импортировано записей',
+        default=0,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата обновления',
+        auto_now=True,
+    )
+
+    def __str__(self):
+        return f'{self.source}: {self.position}'
+
+
+class ImportedPost(models.Model):
+    """Соответствие внешнего идентификатора поста импортированному посту."""
+    source_id = models.CharField(
+        verbose_name='Внешний идентификатор',
+        max_length=64,
+        unique=True,
+    )
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='import_source',
+        verbose_name='Пост',
+    )
+
+    def __str__(self):
+        return self.source_id
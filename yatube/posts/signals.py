@@ -0,0 +1,156 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.storage import file_deleted
+from posts import counters, follows, thumbnails, timeline
+from posts.caching import (INDEX_SCOPE, author_scope, bump_feed_version,
+                           group_scope, post_scope)
+from posts.models import Comment, Group, Post, Profile
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=User)
+def user_profile(sender, instance, created, raw=False, **kwargs):
+    """У каждого пользователя есть профиль со счетчиками."""
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_remember_previous(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние группу и картинку поста для пересчета
+    счетчиков и миниатюр."""
+    previous = None
+    if instance.pk is not None and not raw:
+        previous = Post.objects.filter(
+            pk=instance.pk,
+        ).values_list('group_id', 'image').first()
+    instance._previous_group_id, instance._previous_image = (
+        previous or (None, None)
+    )
+    # Новый файл при сохранении добавит ссылку в хранилище
+    instance._image_uploaded = bool(
+        instance.image and not instance.image._committed
+    )
+
+
+@receiver(pre_save, sender=Post)
+def post_describe_image(sender, instance, raw=False, **kwargs):
+    """Новая картинка получает размеры и превью до записи поста,
+    чтобы шаблоны не открывали файл."""
+    image = instance.image
+    if raw or (image and image._committed
+               and image.name == instance._previous_image):
+        return
+    instance.image_width = instance.image_height = None
+    instance.image_placeholder = ''
+    if not image:
+        return
+    try:
+        image.open()
+        (
+            instance.image_width,
+            instance.image_height,
+            instance.image_placeholder,
+        ) = thumbnails.describe_image(image)
+    except (OSError, SuspiciousFileOperation):
+        logger.warning('Не удалось прочитать картинку %s', image.name)
+    finally:
+        if image._committed:
+            image.close()
+        else:
+            image.seek(0)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    """Сохранение поста обновляет ленты, их кэш и счетчики."""
+    if raw:
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    bump_feed_version(
+        INDEX_SCOPE,
+        author_scope(instance.author_id),
+        group_scope(instance.group_id),
+        group_scope(previous_group_id),
+        post_scope(instance.pk),
+    )
+    image = instance.image.name
+    previous_image = getattr(instance, '_previous_image', None)
+    if image != previous_image:
+        if image:
+            thumbnails.schedule(image)
+        if previous_image:
+            instance.image.storage.delete(previous_image)
+    elif image and getattr(instance, '_image_uploaded', False):
+        # Загружена та же картинка: у поста остается одна ссылка на файл
+        instance.image.storage.delete(image)
+    if created:
+        timeline.fan_out(instance)
+        counters.increment(Profile, instance.author_id, 'posts_count')
+        counters.increment(Group, instance.group_id, 'posts_count')
+        return
+    if previous_group_id != instance.group_id:
+        counters.increment(Group, previous_group_id, 'posts_count', -1)
+        counters.increment(Group, instance.group_id, 'posts_count')
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    """Удаленный пост вычитается из счетчиков и кэша лент и
+    освобождает свою картинку."""
+    bump_feed_version(
+        INDEX_SCOPE,
+        author_scope(instance.author_id),
+        group_scope(instance.group_id),
+        post_scope(instance.pk),
+    )
+    counters.increment(Profile, instance.author_id, 'posts_count', -1)
+    counters.increment(Group, instance.group_id, 'posts_count', -1)
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+
+
+@receiver(file_deleted)
+def image_file_deleted(sender, name, **kwargs):
+    """Вместе с картинкой без ссылок удаляются ее копии для srcset."""
+    thumbnails.delete_variants(name)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    """Название группы выводится в лентах и карточках постов,
+    их кэш устаревает."""
+    if not created and not raw:
+        Post.objects.filter(group=instance).update(modified=timezone.now())
+        bump_feed_version(INDEX_SCOPE, group_scope(instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    """Новый комментарий увеличивает счетчик поста."""
+    if created and not raw:
+        counters.increment(Post, instance.post_id, 'comments_count')
+        bump_feed_version(post_scope(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    """Удаленный комментарий уменьшает счетчик поста."""
+    counters.increment(Post, instance.post_id, 'comments_count', -1)
+    bump_feed_version(post_scope(instance.post_id))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    """Подписки удаляемого пользователя снимаются через posts.follows,
+    иначе каскад оставил бы неверные счетчики у остальных."""
+    follows.forget(instance.pk)
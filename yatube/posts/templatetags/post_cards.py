@@ -0,0 +1,38 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from posts import thumbnails
+from posts.caching import post_card_key
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Карточки постов страницы: одно чтение кэша на всю страницу,
+    рендерятся только отсутствующие в кэше карточки. Миниатюры для них
+    ищутся одним пакетным запросом к кэшу.
+
+    Карточка с заглушкой вместо еще не готовой миниатюры не кэшируется.
+    """
+    posts = list(posts)
+    keys = [post_card_key(post) for post in posts]
+    cards = cache.get_many(keys)
+    images = thumbnails.ready_thumbnails(
+        post.image for key, post in zip(keys, posts) if key not in cards
+    )
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key in cards:
+            continue
+        im = images.get(post.image.name)
+        cards[key] = render_to_string(
+            'includes/post_card.html', {'post': post, 'im': im},
+        )
+        if im or not post.image:
+            missing[key] = cards[key]
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIME)
+    return [cards[key] for key in keys]
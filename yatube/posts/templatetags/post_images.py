@@ -0,0 +1,11 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(image):
+    """Готовая миниатюра картинки поста или None, пока она строится."""
+    return thumbnails.ready_thumbnail(image)
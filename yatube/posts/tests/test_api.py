@@ -0,0 +1,123 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import api_urls
+from posts.models import Comment, Group, Post
+from posts.utils import encode_cursor
+
+User = get_user_model()
+
+POSTS_TOTAL = 5
+
+
+class ApiTest(TestCase):
+    """Тестирование JSON API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание',
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {number}',
+            )
+            for number in range(POSTS_TOTAL)
+        ]
+        cls.post = cls.posts[-1]
+        Comment.objects.create(
+            post=cls.post, author=cls.author, text='Комментарий',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_feed_with_sparse_fields(self):
+        """Лента отдает только запрошенные поля."""
+        response = self.client.get(
+            reverse('api_v1:post_list'), {'fields': 'id,author,group'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual(data['results'][0], {
+            'id': self.post.id, 'author': 'author', 'group': 'group',
+        })
+        response = self.client.get(
+            reverse('api_v1:post_list'), {'fields': 'id,password'},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        """Курсоры next и previous проходят ленту без пропусков."""
+        url = reverse('api_v1:user_post_list', args=['author'])
+        seen = []
+        data = self.client.get(url, {'limit': 2, 'fields': 'id'}).json()
+        self.assertIsNone(data['previous'])
+        while True:
+            seen.extend(item['id'] for item in data['results'])
+            if data['next'] is None:
+                break
+            data = self.client.get(data['next']).json()
+        self.assertEqual(seen, [post.id for post in reversed(self.posts)])
+        data = self.client.get(data['previous']).json()
+        self.assertEqual(
+            [item['id'] for item in data['results']],
+            [self.posts[2].id, self.posts[1].id],
+        )
+
+    def test_out_of_range_cursor_returns_first_page(self):
+        """Курсор с id вне диапазона BigAutoField отдает первую страницу."""
+        cursor = encode_cursor(timezone.now(), 10 ** 23)
+        response = self.client.get(
+            reverse('api_v1:post_list'), {'after': cursor, 'fields': 'id'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0], {'id': self.post.id})
+
+    def test_strong_etag(self):
+        """Повторный запрос с ETag получает 304, пока данные не изменились."""
+        url = reverse('api_v1:post_detail', args=[self.post.id])
+        etag = self.client.get(url)['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.filter(id=self.post.id).update(text='Новый текст')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['text'], 'Новый текст')
+
+    def test_comments_and_missing_objects(self):
+        """Комментарии отдаются списком, несуществующие объекты - 404."""
+        response = self.client.get(
+            reverse('api_v1:comment_list', args=[self.post.id]),
+        )
+        self.assertEqual(response.json()['results'][0]['text'], 'Комментарий')
+        for url in (
+            reverse('api_v1:post_detail', args=[0]),
+            reverse('api_v1:group_post_list', args=['missing']),
+            reverse('api_v1:user_post_list', args=['missing']),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_api_views_stay_within_budget(self):
+        """Ответы API не превышают бюджет запросов и не делают N+1."""
+        kwargs = {
+            'post_id': self.post.id,
+            'slug': self.group.slug,
+            'username': self.author.username,
+        }
+        for pattern in api_urls.urlpatterns:
+            with self.subTest(view=pattern.name):
+                url = reverse(f'api_v1:{pattern.name}', kwargs={
+                    name: kwargs[name] for name in pattern.pattern.converters
+                })
+                self.assertEqual(self.client.get(url).status_code, 200)
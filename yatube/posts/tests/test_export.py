@@ -0,0 +1,92 @@
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ExportTest(TestCase):
+    """Тестирование потоковой выгрузки контента."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.temp_dir = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Текст, с запятой',
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.admin = User.objects.create(username='admin', is_staff=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def test_command_writes_gzipped_jsonl(self):
+        """Команда выгружает все типы записей в сжатый JSONL."""
+        path = os.path.join(self.temp_dir, 'dump.jsonl.gz')
+        call_command('export_posts', path, chunk_size=1, stdout=StringIO())
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['group', 'post', 'comment', 'follow'],
+        )
+        self.assertEqual(records[1]['author'], 'author')
+        self.assertEqual(records[1]['group'], 'group')
+        self.assertEqual(records[2]['post'], self.post.id)
+        self.assertEqual(records[3], {
+            'type': 'follow', 'user': 'reader', 'author': 'author',
+        })
+
+    def test_export_can_be_imported(self):
+        """Выгрузку можно загрузить обратно командой import_posts."""
+        path = os.path.join(self.temp_dir, 'roundtrip.jsonl.gz')
+        call_command('export_posts', path, stdout=StringIO())
+        Post.objects.all().delete()
+        call_command('import_posts', path, stdout=StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.text, self.post.text)
+        self.assertEqual(post.pub_date, self.post.pub_date)
+        self.assertEqual(post.comments.get().author, self.reader)
+
+    def test_endpoint_streams_csv_for_staff(self):
+        """Администратор получает поток CSV, остальные - нет."""
+        url = reverse('posts:export') + '?format=csv&table=post'
+        response = Client().get(url)
+        self.assertEqual(response.status_code, 302)
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['text'], self.post.text)
+        self.assertEqual(rows[0]['author'], 'author')
+        response = client.get(reverse('posts:export') + '?table=users')
+        self.assertEqual(response.status_code, 404)
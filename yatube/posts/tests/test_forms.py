@@ -1,18 +1,49 @@
+import hashlib
 import shutil
+import struct
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from posts.forms import PostForm
 from posts.models import Comment, Group, Post
+from posts.uploads import normalize_image
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 NEW_POST_TEXT = 'Новое сообщение!!!'
 
 
+def make_mpo(first, second):
+    """Склеивает два JPEG в MPO с индексом MP в сегменте APP2."""
+    entries_offset = 8 + 2 + 3 * 12 + 4
+    index_size = entries_offset + 2 * 16
+    segment_size = 2 + 2 + 4 + index_size
+    # Смещения кадров считаются от заголовка TIFF внутри APP2
+    header_offset = 2 + 2 + 2 + 4
+    second_offset = len(first) + segment_size - header_offset
+    index = b''.join((
+        b'II*\x00', struct.pack('<I', 8),
+        struct.pack('<H', 3),
+        struct.pack('<HHI4s', 0xB000, 7, 4, b'0100'),
+        struct.pack('<HHII', 0xB001, 4, 1, 2),
+        struct.pack('<HHII', 0xB002, 7, 32, entries_offset),
+        struct.pack('<I', 0),
+        struct.pack('<IIIHH', 0x20030000, len(first) + segment_size, 0, 0, 0),
+        struct.pack('<IIIHH', 0x020002, len(second), second_offset, 0, 0),
+    ))
+    segment = (
+        b'\xff\xe2' + struct.pack('>H', 2 + 4 + index_size)
+        + b'MPF\x00' + index
+    )
+    return first[:2] + segment + first[2:] + second
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormTests(TestCase):
     @classmethod
@@ -43,7 +74,7 @@ class PostFormTests(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
-        small_gif = (
+        self.small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
@@ -53,7 +84,7 @@ class PostFormTests(TestCase):
         )
         self.uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=self.small_gif,
             content_type='image/gif',
         )
 
@@ -75,13 +106,117 @@ class PostFormTests(TestCase):
             kwargs={'username': 'NoName'},
         ))
         self.assertEqual(Post.objects.count(), posts_count + 1)
+        digest = hashlib.sha256(self.small_gif).hexdigest()
         post = Post.objects.filter(
             text=form_data['text'],
             group=self.test_group.id,
-            image='posts/small.gif',
+            image=f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif',
         )
         self.assertTrue(post.exists())
 
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_post_image_normalized(self):
+        """Картинка уменьшается, поворачивается по EXIF и теряет
+        метаданные."""
+        image = Image.new('RGB', (400, 200), color=(200, 0, 0))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        original = BytesIO()
+        image.save(original, 'JPEG', quality=100, exif=exif)
+        uploaded = SimpleUploadedFile(
+            'photo.jpg', original.getvalue(), 'image/jpeg',
+        )
+        form = PostForm(
+            data={'text': NEW_POST_TEXT},
+            files={'image': uploaded},
+        )
+        self.assertTrue(form.is_valid())
+        self.assertGreater(form.image_bytes_saved, 0)
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (50, 100))
+            self.assertEqual(len(stored.getexif()), 0)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_png_metadata_stripped(self):
+        """Повернутая PNG не сохраняет EXIF и ICC-профиль исходной."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Canon'
+        original = BytesIO()
+        Image.new('RGB', (300, 200), color=(0, 200, 0)).save(
+            original, 'PNG', exif=exif, icc_profile=b'icc-profile',
+        )
+        uploaded = SimpleUploadedFile(
+            'photo.png', original.getvalue(), 'image/png',
+        )
+        image, saved = normalize_image(uploaded)
+        with Image.open(image) as stored:
+            self.assertEqual(stored.size, (67, 100))
+            self.assertEqual(len(stored.getexif()), 0)
+            self.assertNotIn('icc_profile', stored.info)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_mpo_normalized_from_first_frame(self):
+        """Снимок MPO уменьшается и поворачивается как обычный JPEG."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        first, second = BytesIO(), BytesIO()
+        Image.new('RGB', (400, 200), color=(200, 0, 0)).save(
+            first, 'JPEG', exif=exif,
+        )
+        Image.new('RGB', (400, 200)).save(second, 'JPEG')
+        uploaded = SimpleUploadedFile(
+            'photo.jpg',
+            make_mpo(first.getvalue(), second.getvalue()),
+            'image/jpeg',
+        )
+        with Image.open(uploaded) as source:
+            self.assertEqual(source.format, 'MPO')
+        image, saved = normalize_image(uploaded)
+        self.assertGreater(saved, 0)
+        with Image.open(image) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+            self.assertEqual(stored.size, (50, 100))
+            self.assertEqual(len(stored.getexif()), 0)
+
+    def test_small_image_not_recompressed(self):
+        """Картинку без уменьшения, поворота и метаданных, копия
+        которой не меньше, не пересжимают."""
+        original = BytesIO()
+        Image.new('RGB', (40, 20)).save(
+            original, 'JPEG', quality=30, optimize=True,
+        )
+        uploaded = SimpleUploadedFile(
+            'small.jpg', original.getvalue(), 'image/jpeg',
+        )
+        image, saved = normalize_image(uploaded)
+        self.assertIs(image, uploaded)
+        self.assertEqual(saved, 0)
+
+    def test_metadata_stripped_without_negative_saving(self):
+        """Метаданные убираются, даже если копия вышла больше, а
+        экономия при этом не отрицательная."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        original = BytesIO()
+        Image.new('RGB', (40, 20)).save(
+            original, 'JPEG', quality=30, exif=exif,
+        )
+        uploaded = SimpleUploadedFile(
+            'photo.jpg', original.getvalue(), 'image/jpeg',
+        )
+        image, saved = normalize_image(uploaded)
+        self.assertIsNot(image, uploaded)
+        self.assertGreaterEqual(saved, 0)
+        self.assertEqual(saved, max(uploaded.size - image.size, 0))
+        with Image.open(image) as stored:
+            self.assertEqual(len(stored.getexif()), 0)
+
     def test_post_edit(self):
         """Валидная форма редактирует существующую запись в Post."""
         posts_count = Post.objects.count()
@@ -126,3 +261,45 @@ class PostFormTests(TestCase):
         )
         self.assertEqual(Comment.objects.count(), comments_count + 1)
         self.assertTrue(Comment.objects.filter(text='Другой комментарий'))
+
+    def test_ajax_comment_returns_fragment(self):
+        """AJAX-запрос получает только разметку нового комментария."""
+        url = reverse(
+            'posts:add_comment', kwargs={'post_id': self.test_post.id},
+        )
+        response = self.authorized_client.post(
+            url,
+            data={'text': 'Комментарий без перезагрузки'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTemplateUsed(response, 'includes/comment.html')
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(
+            response, 'Комментарий без перезагрузки', status_code=201,
+        )
+        response = self.authorized_client.post(
+            url, data={'text': ''}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_json_comment(self):
+        """Клиент, принимающий JSON, получает id и разметку комментария."""
+        url = reverse(
+            'posts:add_comment', kwargs={'post_id': self.test_post.id},
+        )
+        response = self.authorized_client.post(
+            url,
+            data={'text': 'Комментарий в JSON'},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        comment = Comment.objects.get(text='Комментарий в JSON')
+        data = response.json()
+        self.assertEqual(data['id'], comment.id)
+        self.assertIn('Комментарий в JSON', data['html'])
+        response = self.authorized_client.post(
+            url, data={'text': ''}, HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['errors'])
@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from posts.models import (Comment, Follow, Group, ImportCheckpoint, Post,
+                          Profile, Timeline)
+
+User = get_user_model()
+
+RECORDS = [
+    {'type': 'group', 'slug': 'travel', 'title': 'Путешествия'},
+    {'type': 'post', 'id': 1, 'author': 'leo', 'group': 'travel',
+     'text': 'Первый пост', 'pub_date': '2020-01-02T10:00:00'},
+    {'type': 'post', 'id': 2, 'author': 'anna', 'group': 'books',
+     'text': 'Второй пост', 'pub_date': '2021-05-06T12:30:00'},
+    {'type': 'comment', 'post': 1, 'author': 'anna',
+     'text': 'Комментарий', 'created': '2020-01-03T08:00:00'},
+    {'type': 'follow', 'user': 'anna', 'author': 'leo'},
+    {'type': 'follow', 'user': 'anna', 'author': 'anna'},
+]
+
+
+class ImportPostsTest(TestCase):
+    """Тестирование команды import_posts."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.temp_dir = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def write_jsonl(self, name, records):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def test_records_imported_with_original_dates(self):
+        """Импортируются все типы записей с исходными датами."""
+        path = self.write_jsonl('data.jsonl', RECORDS)
+        call_command('import_posts', path, batch_size=2, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        post = Post.objects.get(text='Первый пост')
+        self.assertEqual(post.author.username, 'leo')
+        self.assertEqual(post.group.title, 'Путешествия')
+        self.assertEqual(post.pub_date, timezone.make_aware(
+            datetime(2020, 1, 2, 10),
+        ))
+        self.assertEqual(post.import_source.source_id, '1')
+        self.assertEqual(
+            Group.objects.get(slug='books').posts.get().text, 'Второй пост',
+        )
+        comment = Comment.objects.get()
+        self.assertEqual(comment.post, post)
+        self.assertEqual(comment.created, timezone.make_aware(
+            datetime(2020, 1, 3, 8),
+        ))
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(post.author.profile.posts_count, 1)
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск продолжает с сохраненной позиции и не
+        создает дублей, даже если начать файл сначала."""
+        path = self.write_jsonl('resume.jsonl', RECORDS[:3])
+        call_command('import_posts', path, stdout=StringIO())
+        path = self.write_jsonl('resume.jsonl', RECORDS)
+        call_command('import_posts', path, stdout=StringIO())
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.position, len(RECORDS))
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        call_command('import_posts', path, restart=True, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_csv_import(self):
+        """CSV с колонкой type импортируется так же, как JSONL."""
+        path = os.path.join(self.temp_dir, 'data.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(
+                'type,id,author,group,text,pub_date\n'
+                'post,10,leo,,"Пост, из CSV",2019-03-04T05:06:07\n'
+            )
+        call_command('import_posts', path, stdout=StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.text, 'Пост, из CSV')
+        self.assertIsNone(post.group)
+
+    def test_only_touched_counters_and_timelines_updated(self):
+        """После импорта пересчитываются счетчики и ленты только
+        затронутых записей, остальные не трогаются."""
+        User.objects.create(username='leo')
+        reader = User.objects.create(username='reader')
+        Follow.objects.create(user=reader, author=User.objects.get(
+            username='leo',
+        ))
+        bystander = User.objects.create(username='bystander')
+        Profile.objects.filter(user=bystander).update(posts_count=42)
+        path = self.write_jsonl('touched.jsonl', RECORDS)
+        call_command('import_posts', path, batch_size=2, stdout=StringIO())
+        post = Post.objects.get(text='Первый пост')
+        self.assertTrue(
+            Timeline.objects.filter(user=reader, post=post).exists(),
+        )
+        self.assertTrue(Timeline.objects.filter(
+            user__username='anna', post=post,
+        ).exists())
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Group.objects.get(slug='travel').posts_count, 1)
+        self.assertEqual(Profile.objects.get(user=bystander).posts_count, 42)
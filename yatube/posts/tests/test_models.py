@@ -1,7 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
 
-from posts.models import Group, Post
+from posts import follows
+from posts.models import Comment, Follow, Group, Post, Profile, Timeline
 from yatube.settings import FIRST_CHARACTERS
 
 User = get_user_model()
@@ -51,3 +56,133 @@ class GroupModelTest(TestCase):
         group = GroupModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, group.__str__())
+
+
+class TimelineModelTest(TestCase):
+    """Тестирование материализованной ленты подписок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Пост до подписки',
+        )
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка заполняет ленту, отписка ее очищает."""
+        follows.follow(self.reader.pk, [self.author.pk])
+        self.assertTrue(Timeline.objects.filter(
+            user=self.reader,
+            post=self.old_post,
+        ).exists())
+        follows.unfollow(self.reader.pk, [self.author.pk])
+        self.assertFalse(Timeline.objects.filter(user=self.reader).exists())
+
+    def test_admin_follow_updates_timeline_and_counters(self):
+        """Подписка, созданная и удаленная в админке, обновляет ленту
+        и счетчики."""
+        admin = User.objects.create(username='admin', is_superuser=True,
+                                    is_staff=True)
+        client = Client()
+        client.force_login(admin)
+        client.post(reverse('admin:posts_follow_add'), {
+            'user': self.reader.pk, 'author': self.author.pk,
+        })
+        follow = Follow.objects.get(user=self.reader, author=self.author)
+        self.assertTrue(Timeline.objects.filter(user=self.reader).exists())
+        self.assertEqual(
+            Profile.objects.get(user=self.author).followers_count, 1,
+        )
+        client.post(reverse('admin:posts_follow_changelist'), {
+            'action': 'delete_selected',
+            '_selected_action': [follow.pk],
+            'post': 'yes',
+        })
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(Timeline.objects.filter(user=self.reader).exists())
+        self.assertEqual(
+            Profile.objects.get(user=self.author).followers_count, 0,
+        )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков."""
+        follows.follow(self.reader.pk, [self.author.pk])
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        entry = Timeline.objects.get(user=self.reader, post=new_post)
+        self.assertEqual(entry.pub_date, new_post.pub_date)
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        follows.follow(self.reader.pk, [self.author.pk])
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(),
+            self.author.posts.count(),
+        )
+
+
+class CountersModelTest(TestCase):
+    """Тестирование денормализованных счетчиков."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_create_and_delete(self):
+        """Счетчики меняются при создании и удалении записей."""
+        post = Post.objects.create(
+            author=self.author,
+            group=self.group,
+            text='Тестовый пост',
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        follows.follow(self.reader.pk, [self.author.pk])
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(Profile.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(
+            Profile.objects.get(user=self.author).followers_count, 1,
+        )
+        self.assertEqual(
+            Profile.objects.get(user=self.reader).following_count, 1,
+        )
+
+        post.group = None
+        post.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+
+        post.delete()
+        self.assertEqual(Profile.objects.get(user=self.author).posts_count, 0)
+
+    def test_deleted_user_leaves_counters_of_others(self):
+        """Удаление пользователя уменьшает счетчики подписок у тех,
+        с кем он был связан."""
+        follows.follow(self.reader.pk, [self.author.pk])
+        follows.follow(self.author.pk, [self.reader.pk])
+        User.objects.filter(pk=self.reader.pk).delete()
+        profile = Profile.objects.get(user=self.author)
+        self.assertEqual(profile.followers_count, 0)
+        self.assertEqual(profile.following_count, 0)
+
+    def test_reconcile_counters_command(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        Post.objects.create(author=self.author, group=self.group, text='Пост')
+        Profile.objects.update(posts_count=42)
+        Group.objects.update(posts_count=42)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
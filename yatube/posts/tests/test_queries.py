@@ -0,0 +1,219 @@
+import re
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import follows, urls
+from posts.models import Comment, Group, Post
+from yatube.settings import POSTS_COUNT
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+SQLITE_SEQ_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+
+
+def explain(sql):
+    """Возвращает строки плана запроса для текущей СУБД."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql)
+            return [row[0].strip() for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def bad_plan_steps(plan):
+    """Шаги плана с последовательным сканированием или сортировкой."""
+    if connection.vendor == 'postgresql':
+        return [
+            step for step in plan
+            if 'Seq Scan' in step or re.match(r'(->\s*)?Sort\b', step)
+        ]
+    return [
+        step for step in plan
+        if SQLITE_SEQ_SCAN.match(step) or 'TEMP B-TREE' in step
+    ]
+
+
+class QueryPlanTest(TestCase):
+    """Запросы страниц используют индексы и не сортируют на лету."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            group=cls.group,
+            text='Тестовый пост',
+        )
+        Comment.objects.create(
+            post=cls.post,
+            author=cls.reader,
+            text='Тестовый комментарий',
+        )
+        follows.follow(cls.reader.pk, [cls.author.pk])
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def test_views_queries_use_indexes(self):
+        """У запросов страниц нет seq scan и временной сортировки."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                with self.subTest(url=url, sql=sql):
+                    self.assertEqual(bad_plan_steps(explain(sql)), [])
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetTest(TestCase):
+    """Страницы posts укладываются в бюджет запросов и не делают N+1."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create([
+            Post(author=cls.author, group=cls.group, text=f'Пост {number}')
+            for number in range(POSTS_COUNT + 1)
+        ])
+        cls.post = Post.objects.create(
+            author=cls.author,
+            group=cls.group,
+            text='Тестовый пост',
+        )
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=user, text='Комментарий')
+            for user in (cls.author, cls.reader) * POSTS_COUNT
+        ])
+        follows.follow(cls.reader.pk, [cls.author.pk])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def url_for(self, pattern):
+        kwargs = {
+            'slug': self.group.slug,
+            'username': self.author.username,
+            'post_id': self.post.id,
+        }
+        return reverse(f'posts:{pattern.name}', kwargs={
+            name: kwargs[name] for name in pattern.pattern.converters
+        })
+
+    def test_for_feed_loads_page_in_one_query(self):
+        """for_feed() загружает все, что выводят ленты, одним запросом."""
+        with self.assertNumQueries(1):
+            for post in Post.objects.for_feed()[:POSTS_COUNT]:
+                (
+                    post.text, post.pub_date, post.image, post.comments_count,
+                    post.author.username, post.author.get_full_name(),
+                    post.group.slug, post.group.title,
+                )
+
+    def test_every_posts_view_declares_budget(self):
+        """У каждой страницы posts объявлен бюджет запросов."""
+        for pattern in urls.urlpatterns:
+            with self.subTest(view=pattern.name):
+                self.assertIsNotNone(
+                    getattr(pattern.callback, 'query_budget', None),
+                )
+
+    def test_posts_views_stay_within_budget(self):
+        """Страницы posts не превышают бюджет и не делают N+1."""
+        for pattern in urls.urlpatterns:
+            with self.subTest(view=pattern.name):
+                self.client.get(self.url_for(pattern))
+
+    def test_posts_write_views_stay_within_budget(self):
+        """Отправка форм и пакетные подписки не превышают бюджет
+        и не делают N+1."""
+        own_post = Post.objects.create(author=self.reader, text='Свой пост')
+        usernames = [self.author.username]
+        for number in range(3):
+            usernames.append(User.objects.create(username=f'user{number}'))
+        image = SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif')
+        comment_url = reverse('posts:add_comment', args=[self.post.id])
+        requests = [
+            (reverse('posts:post_create'), {
+                'text': 'Пост с картинкой', 'group': self.group.id,
+                'image': image,
+            }, {}),
+            (reverse('posts:post_edit', args=[own_post.id]), {
+                'text': 'Новый текст', 'group': self.group.id,
+            }, {}),
+            (reverse('posts:post_edit', args=[own_post.id]), {
+                'text': 'Новая картинка',
+                'image': SimpleUploadedFile(
+                    'new.gif', SMALL_GIF.replace(b'\xFF' * 3, b'\x00' * 3),
+                    'image/gif',
+                ),
+            }, {}),
+            (comment_url, {'text': 'Комментарий'}, {}),
+            (comment_url, {'text': 'Комментарий'}, {
+                'HTTP_ACCEPT': 'application/json',
+                'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest',
+            }),
+            (reverse('posts:profile_unfollow', args=[self.author]), {}, {}),
+            (reverse('posts:profile_follow', args=[self.author]), {}, {}),
+            (reverse('posts:follow_authors'), {'username': usernames}, {}),
+            (reverse('posts:unfollow_authors'), {'username': usernames}, {}),
+        ]
+        for url, data, extra in requests:
+            with self.subTest(url=url):
+                response = self.client.post(url, data, **extra)
+                self.assertIn(response.status_code, (200, 201, 302))
+        own_post.refresh_from_db()
+        self.assertEqual(own_post.text, 'Новая картинка')
+        self.assertTrue(Post.objects.filter(text='Пост с картинкой').exists())
@@ -0,0 +1,204 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default, get_thumbnail
+
+from posts import thumbnails
+from posts.caching import post_card_key
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+PLACEHOLDER = 'Изображение обрабатывается'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    """Миниатюры строятся в фоне, до этого выводится заглушка."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    def test_pending_thumbnail_shows_placeholder(self):
+        """Пока миниатюра строится, в ленте заглушка и карточка
+        не кэшируется."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, PLACEHOLDER)
+        self.assertIsNone(cache.get(post_card_key(self.post)))
+
+    def test_generated_thumbnail_replaces_placeholder(self):
+        """Построенная миниатюра сразу появляется в ленте и посте."""
+        self.client.get(reverse('posts:index'))
+        thumbnails.generate(self.post.image.name)
+        self.assertTrue(thumbnails.is_ready(self.post.image.name))
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertNotContains(response, PLACEHOLDER)
+                self.assertContains(response, 'cache/')
+
+    def test_generated_variants_are_stored_with_post(self):
+        """Копии картинки описаны в посте и выводятся в srcset."""
+        thumbnails.generate(self.post.image.name)
+        self.post.refresh_from_db()
+        sources = self.post.image_sources
+        self.assertEqual(
+            [source['type'] for source in sources],
+            [mime for _, mime, _ in thumbnails.variant_formats()],
+        )
+        for source in sources:
+            with self.subTest(type=source['type']):
+                self.assertIn(' 480w', source['srcset'])
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, sources[0]['srcset'])
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_variants_of_replaced_image_are_ignored(self):
+        """После замены картинки старые копии не выводятся."""
+        thumbnails.generate(self.post.image.name)
+        self.post.refresh_from_db()
+        self.post.image = SimpleUploadedFile(
+            'new.gif', SMALL_GIF.replace(b'\xFF' * 3, b'\x00' * 3),
+            'image/gif',
+        )
+        self.post.save()
+        self.assertEqual(self.post.image_sources, [])
+
+    def test_feed_page_resolves_thumbnails_from_cache(self):
+        """Миниатюры страницы читаются из кэша без запросов к
+        хранилищу sorl-thumbnail."""
+        thumbnails.generate(self.post.image.name)
+        self.post.refresh_from_db()
+        with mock.patch.object(
+            default.kvstore, 'get', side_effect=AssertionError,
+        ):
+            response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, PLACEHOLDER)
+        info = thumbnails.ready_thumbnail(self.post.image)
+        self.assertContains(response, f'src="{info.url}"')
+
+    def test_image_size_and_placeholder_stored_with_post(self):
+        """Размеры и превью картинки сохраняются вместе с постом
+        и выводятся, пока миниатюра строится."""
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (2, 1),
+        )
+        self.assertTrue(
+            self.post.image_placeholder.startswith('data:image/jpeg;base64,'),
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.image_placeholder)
+
+    def test_backfill_image_placeholders_command(self):
+        """Команда backfill_image_placeholders заполняет превью."""
+        Post.objects.update(
+            image_width=None, image_height=None, image_placeholder='',
+        )
+        call_command(
+            'backfill_image_placeholders', workers=1, stdout=StringIO(),
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (2, 1),
+        )
+        self.assertNotEqual(self.post.image_placeholder, '')
+
+    def test_generate_thumbnails_command(self):
+        """Команда generate_thumbnails строит недостающие миниатюры."""
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertTrue(thumbnails.is_ready(self.post.image.name))
+        self.assertIn('обработано картинок: 1', out.getvalue())
+
+    def test_generate_thumbnails_command_reports_failures(self):
+        """Сбой одной картинки не прерывает команду generate_thumbnails."""
+        broken = Post.objects.create(
+            author=self.author,
+            text='Пост с испорченной картинкой',
+            image=SimpleUploadedFile('broken.gif', b'GIF89a', 'image/gif'),
+        )
+        out, err = StringIO(), StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out, stderr=err)
+        self.assertTrue(thumbnails.is_ready(self.post.image.name))
+        self.assertIn(broken.image.name, err.getvalue())
+        self.assertIn('обработано картинок: 1', out.getvalue())
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_page_render_does_not_generate_without_pool(self):
+        """Без пула страница не запускает генерацию миниатюр."""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.get(reverse('posts:index'))
+        schedule.assert_not_called()
+        with override_settings(THUMBNAIL_WORKERS=2), mock.patch.object(
+            thumbnails, 'schedule',
+        ) as schedule:
+            cache.clear()
+            self.client.get(reverse('posts:index'))
+        schedule.assert_called_once_with(self.post.image.name)
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_generation_waits_for_end_of_request(self):
+        """Без пула миниатюры строятся после ответа, а не внутри него."""
+        with mock.patch.object(thumbnails, 'generate') as generate:
+            thumbnails._defer_generation(sender=None)
+            thumbnails._submit(self.post.image.name)
+            generate.assert_not_called()
+            thumbnails._run_deferred(sender=None)
+        generate.assert_called_once_with(self.post.image.name)
+
+    def test_rolled_back_schedule_is_not_pending(self):
+        """Откат транзакции не оставляет картинку в очереди навсегда."""
+        name = self.post.image.name
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            thumbnails.schedule(name)
+            raise RuntimeError
+        self.assertNotIn(name, thumbnails._pending)
+
+    def test_thumbnail_name_matches_sorl(self):
+        """Имя миниатюры совпадает с тем, что строит sorl-thumbnail."""
+        name = self.post.image.name
+        for geometry, options in thumbnails.FEED_THUMBNAILS:
+            with self.subTest(geometry=geometry):
+                self.assertEqual(
+                    thumbnails.thumbnail_name(name, geometry, options),
+                    get_thumbnail(name, geometry, **options).name,
+                )
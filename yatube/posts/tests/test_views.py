@@ -1,6 +1,6 @@
+import json
 import shutil
 import tempfile
-import time
 
 from django import forms
 from django.conf import settings
@@ -9,8 +9,12 @@ from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Comment, Follow, Group, Post
+from posts import follows
+from posts.caching import post_card_key
+from posts.models import Comment, Follow, Group, Post, Profile, Timeline
+from posts.utils import encode_cursor
 from yatube.settings import POSTS_COUNT, POSTS_TEST_COUNT
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -296,19 +300,118 @@ class PostPagesTest(TestCase):
 
     # Проверка кэширования стартовой страницы
     def test_cached_index_page(self):
-        """Стартовая страница сохранена в кэше."""
+        """Стартовая страница сохранена в кэше до изменения постов."""
         cached_response1 = self.authorized_client1.get(reverse('posts:index'))
-        Post.objects.filter(id=self.test_post.id).delete()
+        # update() не вызывает сигналов, версия ленты не меняется
+        Post.objects.filter(id=self.test_post.id).update(text='Новый текст')
         cached_response2 = self.authorized_client1.get(reverse('posts:index'))
         self.assertEqual(cached_response1.content, cached_response2.content)
 
-        time.sleep(20)
+        Post.objects.filter(id=self.test_post.id).delete()
         cached_response3 = self.authorized_client1.get(reverse('posts:index'))
         self.assertNotEqual(
             cached_response1.content,
             cached_response3.content,
         )
 
+    def test_cached_feed_pages_are_separate(self):
+        """Разные страницы ленты кэшируются по отдельности."""
+        Post.objects.bulk_create([
+            Post(text=f'Пост {number}', author=self.test_user1)
+            for number in range(POSTS_COUNT)
+        ])
+        first_page = self.guest_client.get(reverse('posts:index'))
+        second_page = self.guest_client.get(
+            reverse('posts:index') + '?page=2'
+        )
+        self.assertNotEqual(first_page.content, second_page.content)
+
+    def test_edited_post_invalidates_group_and_profile_cache(self):
+        """Правка поста сразу видна в ленте группы и профиля."""
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': self.ok_group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user1}),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        self.test_post.text = 'Отредактированный текст'
+        self.test_post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Отредактированный текст')
+
+    def test_post_cards_are_cached_per_post(self):
+        """Правка поста меняет только его карточку в кэше."""
+        other_post = Post.objects.create(
+            text='Другой пост',
+            author=self.test_user1,
+        )
+        self.test_post.refresh_from_db()
+        self.guest_client.get(reverse('posts:index'))
+        other_key = post_card_key(other_post)
+        old_key = post_card_key(self.test_post)
+        self.assertIsNotNone(cache.get(other_key))
+        self.assertIsNotNone(cache.get(old_key))
+        self.test_post.text = 'Отредактированный текст'
+        self.test_post.save()
+        self.assertNotEqual(post_card_key(self.test_post), old_key)
+        other_post.refresh_from_db()
+        self.assertEqual(post_card_key(other_post), other_key)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Отредактированный текст')
+        self.assertIsNotNone(cache.get(post_card_key(self.test_post)))
+
+    def test_renamed_group_invalidates_post_cards(self):
+        """Новое название группы видно в карточках ее постов."""
+        self.guest_client.get(reverse('posts:index'))
+        self.ok_group.title = 'Новое название группы'
+        self.ok_group.save()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новое название группы')
+
+    def test_anonymous_pages_support_conditional_get(self):
+        """Анонимный посетитель получает 304 на неизмененную страницу."""
+        # Для проверки версий нужен только поиск группы, автора или поста
+        url_queries = {
+            reverse('posts:index'): 0,
+            reverse(
+                'posts:group_list',
+                kwargs={'slug': self.ok_group.slug},
+            ): 1,
+            reverse('posts:profile', kwargs={'username': self.user1}): 1,
+            reverse(
+                'posts:post_detail',
+                kwargs={'post_id': self.test_post.id},
+            ): 1,
+        }
+        for url, queries in url_queries.items():
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                etag = response['ETag']
+                self.assertTrue(response.has_header('Last-Modified'))
+                with self.assertNumQueries(queries):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag,
+                    )
+                self.assertEqual(response.status_code, 304)
+
+    def test_anonymous_page_changes_after_new_comment(self):
+        """Новый комментарий меняет ETag страницы поста."""
+        url = reverse(
+            'posts:post_detail',
+            kwargs={'post_id': self.test_post.id},
+        )
+        etag = self.guest_client.get(url)['ETag']
+        Comment.objects.create(
+            post=self.test_post,
+            author=self.user1,
+            text='Новый комментарий',
+        )
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый комментарий')
+
     # Проверка работоcпособности подписки/отписки
     def test_follow(self):
         """При подписке создается соответствующая запись в БД."""
@@ -338,6 +441,46 @@ class PostPagesTest(TestCase):
         ).exists()
         self.assertFalse(follow_exists)
 
+    def test_batch_follow_is_idempotent(self):
+        """Пакетная подписка возвращает JSON и не создает дублей."""
+        user3 = get_user_model().objects.create(username='TestUser3')
+        url = reverse('posts:follow_authors')
+        data = {'usernames': ['TestUser2', 'TestUser3', 'NoName', 'ghost']}
+        for _ in range(2):
+            response = self.authorized_client1.post(
+                url, json.dumps(data), content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {
+                'usernames': ['TestUser2', 'TestUser3'],
+                'not_found': ['ghost'],
+            })
+        self.assertEqual(
+            Follow.objects.filter(user=self.user1).count(), 2,
+        )
+        self.assertEqual(Profile.objects.get(user=user3).followers_count, 1)
+        self.user1.profile.refresh_from_db()
+        self.assertEqual(self.user1.profile.following_count, 2)
+
+    def test_batch_unfollow(self):
+        """Пакетная отписка удаляет подписки и посты из ленты."""
+        response = self.authorized_client2.post(
+            reverse('posts:unfollow_authors'), {'username': ['NoName']},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Follow.objects.filter(user=self.user2).exists())
+        self.assertFalse(Timeline.objects.filter(user=self.user2).exists())
+        self.user2.profile.refresh_from_db()
+        self.assertEqual(self.user2.profile.following_count, 0)
+        response = self.authorized_client2.get(
+            reverse('posts:unfollow_authors'),
+        )
+        self.assertEqual(response.status_code, 405)
+        response = self.authorized_client2.post(
+            reverse('posts:unfollow_authors'), {},
+        )
+        self.assertEqual(response.status_code, 400)
+
     def test_follow_index_page_display_followed_author_post(self):
         """В ленте подписок появляются посты соответствующих авторов"""
         kat_post = Post.objects.create(
@@ -346,7 +489,7 @@ class PostPagesTest(TestCase):
             group=self.ok_group,
         )
         # 'TestUser2' подписан на 'NoName'
-        Follow.objects.get_or_create(user=self.user2, author=self.user1)
+        follows.follow(self.user2.pk, [self.user1.pk])
 
         # Пост автора 'NoName' появляется в ленте подписок у 'TestUser2'
         response = self.authorized_client2.get(reverse('posts:follow_index'))
@@ -424,3 +567,41 @@ class PaginatorViewsTest(TestCase):
                     len(response.context['page_obj']),
                     POSTS_TEST_COUNT,
                 )
+
+    def test_cursor_pages_cover_whole_feed(self):
+        """Проверка: курсорная паджинация проходит ленту без пропусков."""
+        response = self.client.get(self.index_reverse)
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), POSTS_COUNT)
+        self.assertTrue(first_page.has_next())
+        self.assertFalse(first_page.has_previous())
+
+        next_cursor = first_page.paginator.next_cursor
+        response = self.client.get(
+            self.index_reverse + f'?after={next_cursor}'
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), POSTS_TEST_COUNT)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+        self.assertEqual(
+            set(first_page) | set(second_page),
+            set(Post.objects.all()),
+        )
+
+        previous_cursor = second_page.paginator.previous_cursor
+        response = self.client.get(
+            self.index_reverse + f'?before={previous_cursor}'
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(first_page),
+        )
+
+    def test_cursor_bad_token_returns_first_page(self):
+        """Проверка: испорченный курсор отдает первую страницу."""
+        response = self.client.get(self.index_reverse + '?after=garbage')
+        self.assertEqual(len(response.context['page_obj']), POSTS_COUNT)
+        huge_pk = encode_cursor(timezone.now(), 10 ** 23)
+        response = self.client.get(self.index_reverse + f'?after={huge_pk}')
+        self.assertEqual(len(response.context['page_obj']), POSTS_COUNT)
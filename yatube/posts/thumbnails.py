@@ -0,0 +1,318 @@
+"""Фоновая генерация миниатюр картинок постов.
+
+Шаблоны не создают миниатюры сами: они только ищут готовую в
+key-value хранилище sorl-thumbnail и, если ее еще нет, выводят
+заглушку. Миниатюры всех размеров из FEED_THUMBNAILS строятся в пуле
+потоков после сохранения поста, после чего кэш лент с этим постом
+сбрасывается.
+
+Без пула (THUMBNAIL_WORKERS = 0, по умолчанию на SQLite) миниатюры
+строятся в том же потоке, но только при сохранении поста и уже после
+отправки ответа. Страницы в этом режиме генерацию не запускают:
+недостающие миниатюры достраивает команда generate_thumbnails.
+"""
+import base64
+import json
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock, local
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signals import request_finished, request_started
+from django.db import connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts.caching import (INDEX_SCOPE, author_scope, bump_feed_version,
+                           group_scope, post_scope)
+from posts.models import Post
+from posts.uploads import EXIF_ORIENTATION, ORIENTATION_TRANSPOSE
+
+logger = logging.getLogger(__name__)
+
+# Размеры, в которых картинки выводятся в шаблонах
+FEED_THUMBNAIL = ('960x339', {'upscale': True})
+FEED_THUMBNAILS = (FEED_THUMBNAIL,)
+# Форматы копий для srcset от самого компактного: (формат Pillow,
+# MIME-тип, расширение). Форматы без поддержки в Pillow пропускаются.
+VARIANT_FORMATS = (
+    ('AVIF', 'image/avif', 'avif'),
+    ('WEBP', 'image/webp', 'webp'),
+    ('JPEG', 'image/jpeg', 'jpg'),
+)
+
+# Адрес и размеры готовой миниатюры, хранятся в кэше
+ThumbnailInfo = namedtuple('ThumbnailInfo', 'url width height')
+
+_executor = None
+_pending = set()
+_lock = Lock()
+# Имена картинок, отложенные в однопоточном режиме до конца запроса
+_deferred = local()
+
+
+def thumbnail_name(name, geometry, options):
+    """Имя файла миниатюры, которое выберет sorl-thumbnail.
+
+    У sorl-thumbnail нет публичного способа узнать имя миниатюры без ее
+    генерации, поэтому здесь повторяется его ThumbnailBackend.
+    get_thumbnail: формат исходника, опции по умолчанию и измененные
+    настройки из extra_options. Используются приватные _get_format и
+    _get_thumbnail_filename; test_thumbnail_name_matches_sorl падает,
+    если имя разойдется с тем, что строит sorl-thumbnail.
+    """
+    backend = default.backend
+    source = ImageFile(name)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(source, geometry, options)
+
+
+def _thumbnail_file(name, geometry, options):
+    return ImageFile(thumbnail_name(name, geometry, options), default.storage)
+
+
+def _info_key(name, variant):
+    geometry, _ = variant
+    return f'thumbnail:{geometry}:{name}'
+
+
+def _remember(name, variant, thumbnail):
+    info = ThumbnailInfo(thumbnail.url, thumbnail.width, thumbnail.height)
+    cache.set(_info_key(name, variant), info, None)
+    return info
+
+
+def ready_thumbnails(images, variant=FEED_THUMBNAIL):
+    """Готовые миниатюры картинок страницы: {имя картинки: ThumbnailInfo
+    или None, пока миниатюра строится}.
+
+    Миниатюры ищутся в кэше одним get_many; к key-value хранилищу
+    sorl-thumbnail обращаются только при промахе кэша. Генерация
+    отсутствующих миниатюр только ставится в очередь пула, а без пула
+    остается команде generate_thumbnails.
+    """
+    names = {_info_key(image.name, variant): image.name for image in images
+             if image}
+    found = cache.get_many(names)
+    result = {}
+    for key, name in names.items():
+        info = found.get(key)
+        if info is None:
+            thumbnail = _lookup(name, variant)
+            if thumbnail is None:
+                if settings.THUMBNAIL_WORKERS:
+                    schedule(name)
+            else:
+                info = _remember(name, variant, thumbnail)
+        result[name] = info
+    return result
+
+
+def ready_thumbnail(image, variant=FEED_THUMBNAIL):
+    """Готовая миниатюра одной картинки или None."""
+    if not image:
+        return None
+    return ready_thumbnails([image], variant)[image.name]
+
+
+def _lookup(name, variant):
+    geometry, options = variant
+    return default.kvstore.get(_thumbnail_file(name, geometry, options))
+
+
+def is_ready(name):
+    """Построены ли все миниатюры картинки."""
+    return all(_lookup(name, variant) for variant in FEED_THUMBNAILS)
+
+
+def describe_image(file):
+    """Размеры картинки и ее крошечное превью в виде data URI.
+
+    JPEG декодируется сразу в уменьшенном масштабе (draft), поэтому
+    превью большой фотографии строится быстро.
+    """
+    image = Image.open(file)
+    orientation = image.getexif().get(EXIF_ORIENTATION)
+    width, height = image.size
+    size = settings.IMAGE_PLACEHOLDER_SIZE
+    image.thumbnail((size, size), Image.BILINEAR, reducing_gap=2.0)
+    if orientation in ORIENTATION_TRANSPOSE:
+        image = image.transpose(ORIENTATION_TRANSPOSE[orientation])
+        if orientation >= 5:
+            # Повороты на 90 градусов меняют стороны местами
+            width, height = height, width
+    buffer = BytesIO()
+    image.convert('RGB').save(buffer, 'JPEG', quality=50)
+    data = base64.b64encode(buffer.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{data}'
+
+
+def variant_formats():
+    """Форматы копий, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [fmt for fmt in VARIANT_FORMATS if fmt[0] in Image.SAVE]
+
+
+def _variant_widths(source_width):
+    widths = settings.IMAGE_VARIANT_WIDTHS
+    # Маленькую картинку растягиваем до наименьшей ширины, как и
+    # миниатюру ленты, а большие копии из нее не строим.
+    return [w for w in widths if w <= source_width] or [min(widths)]
+
+
+def _variant_prefix(name):
+    return f'variants/{os.path.splitext(name)[0]}_'
+
+
+def delete_variants(name):
+    """Удаляет все копии картинки, в том числе ширин и форматов,
+    которых уже нет в настройках."""
+    directory, prefix = os.path.split(_variant_prefix(name))
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for file in files:
+        if file.startswith(prefix):
+            default_storage.delete(f'{directory}/{file}')
+
+
+def build_variants(name):
+    """Сохраняет копии картинки нескольких ширин в компактных форматах.
+
+    Копии обрезаются до пропорций миниатюры ленты. Возвращает
+    описание копий для Post.image_variants.
+    """
+    geometry, _ = FEED_THUMBNAIL
+    feed_width, feed_height = map(int, geometry.split('x'))
+    with Post.image.field.storage.open(name) as file:
+        source = ImageOps.exif_transpose(Image.open(file)).convert('RGB')
+    prefix = _variant_prefix(name)
+    variants = []
+    for width in _variant_widths(source.width):
+        height = round(width * feed_height / feed_width)
+        image = ImageOps.fit(source, (width, height), Image.LANCZOS)
+        for fmt, mime, extension in variant_formats():
+            buffer = BytesIO()
+            image.save(
+                buffer, fmt, quality=settings.IMAGE_VARIANT_QUALITY,
+            )
+            path = f'{prefix}{width}.{extension}'
+            default_storage.delete(path)
+            variants.append({
+                'type': mime,
+                'width': width,
+                'height': height,
+                'name': default_storage.save(
+                    path, ContentFile(buffer.getvalue()),
+                ),
+            })
+    return {'source': name, 'variants': variants}
+
+
+def generate(name):
+    """Строит все миниатюры и копии картинки и сбрасывает кэш ее
+    постов."""
+    for variant in FEED_THUMBNAILS:
+        geometry, options = variant
+        _remember(name, variant, get_thumbnail(name, geometry, **options))
+    variants = build_variants(name)
+    posts = Post.objects.filter(image=name)
+    scopes = [INDEX_SCOPE]
+    for post_id, author_id, group_id in posts.values_list(
+        'id', 'author_id', 'group_id',
+    ):
+        scopes += [
+            post_scope(post_id), author_scope(author_id),
+            group_scope(group_id),
+        ]
+    posts.update(
+        modified=timezone.now(),
+        image_variants=json.dumps(variants),
+    )
+    bump_feed_version(*scopes)
+
+
+def _run(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def _run_in_thread(name):
+    try:
+        _run(name)
+    finally:
+        connections.close_all()
+
+
+def _submit(name):
+    global _executor
+    if not settings.THUMBNAIL_WORKERS:
+        deferred = getattr(_deferred, 'names', None)
+        if deferred is None:
+            _run(name)
+        else:
+            deferred.append(name)
+        return
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    _executor.submit(_run_in_thread, name)
+
+
+def _enqueue(name):
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    _submit(name)
+
+
+def schedule(name):
+    """Ставит генерацию миниатюр в очередь после фиксации транзакции.
+
+    Имя попадает в _pending только при фиксации: при откате колбэк
+    отбрасывается, и картинку можно будет поставить в очередь снова.
+    """
+    transaction.on_commit(lambda: _enqueue(name))
+
+
+@receiver(request_started)
+def _defer_generation(sender, **kwargs):
+    _deferred.names = []
+
+
+@receiver(request_finished)
+def _run_deferred(sender, **kwargs):
+    """Однопоточный режим: миниатюры строятся после отправки ответа,
+    их запросы не входят в бюджет страницы и не задерживают ее."""
+    names, _deferred.names = getattr(_deferred, 'names', None) or [], None
+    for name in names:
+        _run(name)
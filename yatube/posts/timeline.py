@@ -0,0 +1,87 @@
+"""Материализованная лента подписок (fan-out-on-write).
+
+Каждый новый пост копируется в Timeline всех подписчиков автора,
+поэтому страница подписок читается одним диапазоном по (user, pub_date).
+"""
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+
+from posts.models import Follow, Post, Timeline
+
+
+def _insert(entries):
+    """Вставляет записи ленты пачками по TIMELINE_BATCH_SIZE, не держа
+    в памяти больше одной пачки."""
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, settings.TIMELINE_BATCH_SIZE))
+        if not batch:
+            return
+        Timeline.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Добавляет пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id,
+    ).values_list('user_id', flat=True)
+    _insert(
+        Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def fan_out_many(posts):
+    """Добавляет посты (id, author_id, pub_date) в ленты подписчиков
+    их авторов."""
+    by_author = defaultdict(list)
+    for post_id, author_id, pub_date in posts:
+        by_author[author_id].append((post_id, pub_date))
+    followers = Follow.objects.filter(
+        author_id__in=by_author,
+    ).values_list('user_id', 'author_id')
+    _insert(
+        Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for user_id, author_id in followers.iterator()
+        for post_id, pub_date in by_author[author_id]
+    )
+
+
+def backfill(user_id, *author_ids):
+    """Заполняет ленту подписчика постами авторов."""
+    posts = Post.objects.filter(
+        author_id__in=author_ids,
+    ).values_list('id', 'pub_date')
+    _insert(
+        Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator(
+            chunk_size=settings.TIMELINE_BATCH_SIZE,
+        )
+    )
+
+
+def trim(user_id, *author_ids):
+    """Удаляет из ленты подписчика посты авторов."""
+    Timeline.objects.filter(
+        user_id=user_id,
+        post__author_id__in=author_ids,
+    ).delete()
+
+
+def rebuild(users=None):
+    """Пересобирает ленты с нуля, возвращает число подписок."""
+    entries = Timeline.objects.all()
+    follows = Follow.objects.all()
+    if users is not None:
+        entries = entries.filter(user__in=users)
+        follows = follows.filter(user__in=users)
+    entries.delete()
+    count = 0
+    for user_id, author_id in follows.values_list(
+        'user_id', 'author_id',
+    ).iterator():
+        backfill(user_id, author_id)
+        count += 1
+    return count
@@ -0,0 +1,98 @@
+"""Нормализация загружаемых картинок постов.
+
+Перед сохранением картинка уменьшается до IMAGE_UPLOAD_MAX_SIZE по
+большей стороне, поворачивается по EXIF и пересохраняется без
+метаданных с качеством IMAGE_UPLOAD_QUALITY. JPEG декодируется сразу
+в уменьшенном масштабе (draft), остальные форматы уменьшаются
+целочисленным reduce перед ресемплингом, поэтому память не зависит
+от размера исходного снимка.
+
+MPO (JPEG с несколькими кадрами) всегда пересохраняется обычным JPEG
+из первого кадра. Остальные картинки, которые не пришлось ни уменьшать,
+ни поворачивать, пересохраняются, только если копия меньше или в
+исходной есть метаданные; иначе сохраняется исходный файл без лишнего
+пересжатия.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+EXIF_ORIENTATION = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+# Форматы, которые пересохраняются
+NORMALIZED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+# Ключи Image.info с метаданными, которые не попадают в копию
+METADATA_KEYS = ('exif', 'icc_profile', 'comment', 'xmp', 'XML:com.adobe.xmp')
+
+
+def _save_options(fmt):
+    if fmt == 'PNG':
+        return {'optimize': True}
+    options = {'quality': settings.IMAGE_UPLOAD_QUALITY}
+    if fmt == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    return options
+
+
+def _has_metadata(image):
+    text = getattr(image, 'text', None) if image.format == 'PNG' else None
+    return bool(text) or any(image.info.get(key) for key in METADATA_KEYS)
+
+
+def normalize_image(upload):
+    """Возвращает картинку для сохранения и число сэкономленных байт.
+
+    Анимированные картинки и форматы не из NORMALIZED_FORMATS, а также
+    картинки, копия которых не нужна (см. описание модуля),
+    возвращаются без изменений. Если копия без метаданных вышла больше
+    исходной, сэкономлено 0 байт.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    # Pillow открывает как MPO только JPEG с несколькими кадрами
+    # (снимки телефонов), поэтому is_animated у него всегда истинно.
+    # Сохраняется только основной первый кадр.
+    is_mpo = image.format == 'MPO'
+    if is_mpo:
+        image.seek(0)
+    fmt = 'JPEG' if is_mpo else image.format
+    animated = not is_mpo and getattr(image, 'is_animated', False)
+    if fmt not in NORMALIZED_FORMATS or animated:
+        upload.seek(0)
+        return upload, 0
+    orientation = image.getexif().get(EXIF_ORIENTATION)
+    has_metadata = _has_metadata(image)
+    original_size = image.size
+    max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+    # thumbnail() сам вызывает draft() для JPEG и reduce() для
+    # остальных форматов, а меньшие картинки не увеличивает.
+    image.thumbnail((max_size, max_size), Image.LANCZOS, reducing_gap=2.0)
+    transformed = is_mpo or image.size != original_size
+    if orientation in ORIENTATION_TRANSPOSE:
+        image = image.transpose(ORIENTATION_TRANSPOSE[orientation])
+        transformed = True
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    # thumbnail() и transpose() сохраняют info, а PNG пишет exif и
+    # icc_profile из него: без очистки повернутая копия осталась бы
+    # с Orientation и браузер повернул бы ее второй раз.
+    for key in METADATA_KEYS:
+        image.info.pop(key, None)
+    buffer = BytesIO()
+    image.save(buffer, fmt, **_save_options(fmt))
+    saved = upload.size - buffer.tell()
+    if not transformed and saved <= 0 and not has_metadata:
+        upload.seek(0)
+        return upload, 0
+    normalized = ContentFile(buffer.getvalue(), name=upload.name)
+    return normalized, max(saved, 0)
@@ -16,7 +16,14 @@ urlpatterns = [
         views.add_comment,
         name='add_comment',
     ),
+    path('export/', views.export, name='export'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/authors/', views.follow_authors, name='follow_authors'),
+    path(
+        'follow/authors/delete/',
+        views.unfollow_authors,
+        name='unfollow_authors',
+    ),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
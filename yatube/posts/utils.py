@@ -1,8 +1,128 @@
+import base64
+import binascii
+from datetime import datetime
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+CURSOR_AFTER = 'after'
+CURSOR_BEFORE = 'before'
+# Верхняя граница BigAutoField: больший id не поместится в запрос
+MAX_PK = 2 ** 63 - 1
+
+
+def encode_cursor(pub_date, pk):
+    """Упаковывает ключ (pub_date, id) в непрозрачный токен."""
+    raw = f'{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, при ошибке возвращает None."""
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        pub_date, pk = raw.split('|')
+        pub_date, pk = datetime.fromisoformat(pub_date), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, OverflowError):
+        return None
+    if not 0 < pk <= MAX_PK:
+        return None
+    return pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id).
+
+    Не выполняет COUNT(*) и OFFSET: каждая страница - это выборка
+    per_page + 1 строк по индексу, начиная с позиции курсора.
+    Возвращает обычный Page, у которого номер 1 означает начало ленты,
+    а num_pages известно только до следующей страницы включительно.
+    Токены соседних страниц хранятся в next_cursor и previous_cursor.
+    """
+    is_cursor = True
 
+    def __init__(self, object_list, per_page,
+                 date_field='pub_date', id_field='id'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.id_field = id_field
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._num_pages = 1
 
-def get_paginator(request, posts):
-    paginator = Paginator(posts, settings.POSTS_COUNT)
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    def _cursor(self, obj):
+        return encode_cursor(
+            getattr(obj, self.date_field),
+            getattr(obj, self.id_field),
+        )
+
+    def _fetch(self, key, direction):
+        date_field, id_field = self.date_field, self.id_field
+        queryset = self.object_list
+        if key is not None:
+            pub_date, pk = key
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__{direction}': pub_date})
+                | Q(**{date_field: pub_date, f'{id_field}__{direction}': pk})
+            )
+        if direction == 'gt':
+            queryset = queryset.order_by(date_field, id_field)
+        else:
+            queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        rows = list(queryset[:self.per_page + 1])
+        return rows[:self.per_page], len(rows) > self.per_page
+
+    def get_cursor_page(self, after=None, before=None):
+        key = decode_cursor(before)
+        if key is not None:
+            rows, has_previous = self._fetch(key, 'gt')
+            rows.reverse()
+            has_next = True
+        else:
+            key = decode_cursor(after)
+            rows, has_next = self._fetch(key, 'lt')
+            has_previous = key is not None
+        number = 2 if has_previous else 1
+        self._num_pages = number + 1 if has_next else number
+        if rows and has_next:
+            self.next_cursor = self._cursor(rows[-1])
+        if rows and has_previous:
+            self.previous_cursor = self._cursor(rows[0])
+        return Page(rows, number, self)
+
+
+def get_paginator(request, posts, date_field='pub_date', id_field='id'):
+    """Возвращает страницу ленты.
+
+    По умолчанию используется курсорная паджинация (?after=/?before=),
+    номерная (?page=N) оставлена для старых ссылок.
+    """
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number is not None:
+        paginator = Paginator(posts, settings.POSTS_COUNT)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(
+        posts, settings.POSTS_COUNT, date_field, id_field,
+    )
+    return paginator.get_cursor_page(
+        after=request.GET.get(CURSOR_AFTER),
+        before=request.GET.get(CURSOR_BEFORE),
+    )
+
+
+def ajax_response_format(request):
+    """Формат ответа на AJAX-запрос: 'json', 'html' (фрагмент разметки)
+    или None, если запрос отправлен обычной формой."""
+    if 'application/json' in request.META.get('HTTP_ACCEPT', ''):
+        return 'json'
+    if request.is_ajax():
+        return 'html'
+    return None
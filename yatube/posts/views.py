@@ -1,62 +1,124 @@
+import json
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import require_POST, require_safe
 
+from core.queries import query_budget
+from core.ratelimit import rate_limit
+from posts import exporter, follows
+from posts.caching import (INDEX_SCOPE, author_scope, cache_anonymous_page,
+                           get_feed_cache_context, group_scope, post_scope)
 from posts.forms import CommentForm, PostForm
-from posts.models import Follow, Group, Post
-from posts.utils import get_paginator
+from posts.models import Follow, Group, Post, Timeline
+from posts.utils import ajax_response_format, get_paginator
 
-CACHE_TIME = 20
 User = get_user_model()
 
 
+def index_scopes():
+    return [INDEX_SCOPE]
+
+
+def group_scopes(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True,
+    ).first()
+    if group_id is None:
+        return None
+    return [group_scope(group_id)]
+
+
+def profile_scopes(username):
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True,
+    ).first()
+    if author_id is None:
+        return None
+    return [author_scope(author_id)]
+
+
+def post_detail_scopes(post_id):
+    ids = Post.objects.filter(id=post_id).values_list(
+        'author_id', 'group_id',
+    ).first()
+    if ids is None:
+        return None
+    author_id, group_id = ids
+    return list(filter(None, [
+        post_scope(post_id), author_scope(author_id), group_scope(group_id),
+    ]))
+
+
+@query_budget(3)
+@cache_anonymous_page(index_scopes)
 def index(request):
     """Функция отображения главной страницы."""
-    posts = Post.objects.select_related('author').all()
+    posts = Post.objects.for_feed()
     context = {
-        'page_obj': get_paginator(request, posts),
+        'page_obj': SimpleLazyObject(lambda: get_paginator(request, posts)),
+        **get_feed_cache_context(request, INDEX_SCOPE),
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(4)
+@cache_anonymous_page(group_scopes)
 def group_posts(request, slug):
     """Функция отображения постов выбраной группы."""
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
-    page = get_paginator(request, posts)
+    posts = Post.objects.for_feed().filter(group=group)
     context = {
         'group': group,
         'posts': posts,
-        'page_obj': page,
+        'page_obj': SimpleLazyObject(lambda: get_paginator(request, posts)),
+        **get_feed_cache_context(request, group_scope(group.id)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(5)
+@cache_anonymous_page(profile_scopes)
 def profile(request, username):
     """Функция отображения страницы пользователя."""
-    user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user)
-    page = get_paginator(request, posts)
+    user = get_object_or_404(
+        User.objects.select_related('profile'),
+        username=username,
+    )
+    posts = Post.objects.for_feed().filter(author=user)
     if request.user.is_authenticated is True:
         following = Follow.objects.filter(user=request.user, author=user)
     else:
         following = None
     context = {
-        'page_obj': page,
+        'page_obj': SimpleLazyObject(lambda: get_paginator(request, posts)),
         'author': user,
         'post': posts,
         'following': following,
+        **get_feed_cache_context(request, author_scope(user.id)),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(4)
+@cache_anonymous_page(post_detail_scopes)
 def post_detail(request, post_id):
     """Функция отображения одного поста пользователя."""
-    post = get_object_or_404(Post, id=post_id)
-    author = post.author
-    count_posts = author.posts.all().count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__profile', 'group'),
+        id=post_id,
+    )
+    count_posts = post.author.profile.posts_count
     form_create_comment = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
         'count_posts': count_posts,
@@ -67,7 +129,9 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(13)
 @login_required
+@rate_limit('post_create')
 def post_create(request):
     """Функция создания нового поста пользователя."""
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -83,11 +147,12 @@ def post_create(request):
     return render(request, 'posts/post_create.html', context)
 
 
+@query_budget(11)
 @login_required
 def post_edit(request, post_id):
     """Функция редактирования поста пользователя."""
     edit_post = get_object_or_404(Post, id=post_id)
-    if request.user != edit_post.author:
+    if request.user.pk != edit_post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
         request.POST or None,
@@ -105,43 +170,135 @@ def post_edit(request, post_id):
     return render(request, 'posts/post_create.html', context)
 
 
+@query_budget(5)
 @login_required
+@rate_limit('add_comment')
 def add_comment(request, post_id):
     """Функция создания комментария к посту."""
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
-    if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
-    return redirect('posts:post_detail', post_id=post_id)
+    response_format = ajax_response_format(request)
+    if not form.is_valid():
+        if response_format == 'json':
+            return JsonResponse({'errors': form.errors}, status=400)
+        if response_format == 'html':
+            return HttpResponseBadRequest(form.errors.as_ul())
+        return redirect('posts:post_detail', post_id=post_id)
+    comment = form.save(commit=False)
+    comment.author = request.user
+    comment.post = post
+    comment.save()
+    if response_format is None:
+        return redirect('posts:post_detail', post_id=post_id)
+    # Вместо перехода на страницу поста отдается только новый комментарий
+    html = render_to_string(
+        'includes/comment.html', {'comment': comment}, request,
+    )
+    if response_format == 'json':
+        return JsonResponse({'id': comment.id, 'html': html}, status=201)
+    return HttpResponse(html, status=201)
 
 
+@query_budget(5)
 @login_required
 def follow_index(request):
     """Функция страницы с постами авторов, на которых подписан пользователь."""
-    posts = Post.objects.filter(author__following__user=request.user)
-    followers_cnt = request.user.follower.all().count()
+    entries = Timeline.objects.filter(user=request.user).only(
+        'pub_date', 'post_id',
+    )
+    page = get_paginator(request, entries, id_field='post_id')
+    post_ids = [entry.post_id for entry in page.object_list]
+    posts = Post.objects.for_feed().in_bulk(post_ids)
+    page.object_list = [posts[pk] for pk in post_ids if pk in posts]
+    followers_cnt = request.user.profile.following_count
     context = {
-        'page_obj': get_paginator(request, posts),
+        'page_obj': page,
         'followers_cnt': followers_cnt,
     }
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(10)
 @login_required
+@rate_limit('follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
     """Функция подписки на автора."""
     author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+    follows.follow(request.user.pk, [author.pk])
     return redirect('posts:profile', username=username)
 
 
+@query_budget(10)
 @login_required
+@rate_limit('follow', methods=('GET', 'POST'))
 def profile_unfollow(request, username):
     """Функция отписки на автора."""
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    follows.unfollow(request.user.pk, [author.pk])
     return redirect('posts:profile', username=username)
+
+
+@query_budget(2)
+@require_safe
+@staff_member_required
+def export(request):
+    """Потоковая выгрузка контента в сжатом gzip JSONL или CSV."""
+    fmt = request.GET.get('format', 'jsonl')
+    tables = request.GET.getlist('table')
+    if fmt not in exporter.FORMATS or set(tables) - exporter.TABLES.keys():
+        raise Http404
+    records = exporter.iter_records(tables or None)
+    response = StreamingHttpResponse(
+        exporter.gzip_stream(exporter.iter_lines(records, fmt)),
+        content_type='application/gzip',
+    )
+    name = f'yatube-{timezone.now():%Y%m%d}.{fmt}.gz'
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+
+def _follow_batch(request, action):
+    """Общая часть пакетной подписки и отписки: имена авторов берутся
+    из JSON {"usernames": [...]} или из полей формы username."""
+    if request.content_type == 'application/json':
+        try:
+            usernames = json.loads(request.body).get('usernames')
+        except (ValueError, AttributeError):
+            usernames = None
+    else:
+        usernames = request.POST.getlist('username')
+    if (
+        not isinstance(usernames, list) or not usernames
+        or len(usernames) > settings.FOLLOW_BATCH_SIZE
+        or not all(isinstance(name, str) for name in usernames)
+    ):
+        return JsonResponse({'errors': {'usernames': [
+            f'Нужен список от 1 до {settings.FOLLOW_BATCH_SIZE} имен.'
+        ]}}, status=400)
+    authors = follows.resolve_authors(usernames)
+    authors.pop(request.user.username, None)
+    action(request.user.pk, authors.values())
+    return JsonResponse({
+        'usernames': sorted(authors),
+        'not_found': sorted(
+            set(usernames) - authors.keys() - {request.user.username}
+        ),
+    })
+
+
+@query_budget(10)
+@login_required
+@require_POST
+@rate_limit('follow')
+def follow_authors(request):
+    """Подписка на несколько авторов, ответ в JSON."""
+    return _follow_batch(request, follows.follow)
+
+
+@query_budget(10)
+@login_required
+@require_POST
+@rate_limit('follow')
+def unfollow_authors(request):
+    """Отписка от нескольких авторов, ответ в JSON."""
+    return _follow_batch(request, follows.unfollow)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -59,7 +60,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -149,10 +152,18 @@ STATIC_URL = '/static/'
 
 # STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
+# collectstatic добавляет в имена файлов хэш содержимого и сохраняет
+# рядом сжатые копии; отдает их core.middleware.StaticFilesMiddleware
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
 
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Передача медиафайлов прокси: 'nginx' (X-Accel-Redirect на
+# MEDIA_ACCEL_PREFIX, internal location с alias на MEDIA_ROOT),
+# 'sendfile' (X-Sendfile для Apache и lighttpd) или '' - отдает Django
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -163,6 +174,49 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 POSTS_COUNT: Final[int] = 10
 POSTS_TEST_COUNT: Final[int] = 3
 FIRST_CHARACTERS: Final[int] = 15
+TIMELINE_BATCH_SIZE: Final[int] = 1000
+QUERY_N_PLUS_ONE_THRESHOLD: Final[int] = 3
+FEED_CACHE_TIME: Final[int] = 300
+POST_CARD_CACHE_TIME: Final[int] = 60 * 60 * 24
+CACHE_STALE_TIME: Final[int] = 300
+CACHE_LOCK_TIMEOUT: Final[int] = 10
+IMAGE_VARIANT_WIDTHS: Final[tuple] = (480, 960, 1440)
+IMAGE_VARIANT_QUALITY: Final[int] = 80
+IMAGE_UPLOAD_MAX_SIZE: Final[int] = 2048
+IMAGE_UPLOAD_QUALITY: Final[int] = 85
+IMAGE_PLACEHOLDER_SIZE: Final[int] = 20
+STATIC_MAX_AGE: Final[int] = 60 * 60
+STATIC_IMMUTABLE_MAX_AGE: Final[int] = 60 * 60 * 24 * 365
+STATIC_COMPRESS_MIN_SIZE: Final[int] = 256
+MEDIA_MAX_AGE: Final[int] = 60 * 60
+MEDIA_IMMUTABLE_MAX_AGE: Final[int] = 60 * 60 * 24 * 365
+EXPORT_CHUNK_SIZE: Final[int] = 2000
+FOLLOW_BATCH_SIZE: Final[int] = 100
+API_PAGE_SIZE: Final[int] = 20
+API_MAX_PAGE_SIZE: Final[int] = 100
+IMPORT_BATCH_SIZE: Final[int] = 1000
+
+# Лимиты частоты запросов (core.ratelimit): область -> корзины
+# пользователя и IP-адреса, 'N/период' (s, m, h, d).
+RATE_LIMITS = {
+    'post_create': {'user': '10/m', 'ip': '30/m'},
+    'add_comment': {'user': '20/m', 'ip': '60/m'},
+    'follow': {'user': '30/m', 'ip': '100/m'},
+    'signup': {'ip': '10/h'},
+}
+# Корзины хранятся в общем кэше, мимо L1 в памяти процесса
+RATE_LIMIT_CACHE = 'shared'
+# Сколько прокси перед приложением дописывают адрес в X-Forwarded-For
+RATE_LIMIT_PROXY_COUNT = int(os.getenv('RATE_LIMIT_PROXY_COUNT', 0))
+
+# Потоки фоновой генерации миниатюр; 0 - генерировать синхронно
+# после ответа на сохранение поста.
+# SQLite блокирует таблицу на время записи, поэтому с ним потоки
+# по умолчанию не запускаются.
+THUMBNAIL_WORKERS = int(os.getenv(
+    'THUMBNAIL_WORKERS',
+    0 if DATABASES['default']['ENGINE'].endswith('sqlite3') else 2,
+))
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -172,11 +226,42 @@ LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Проверка бюджета SQL-запросов страниц: в тестах нарушения - это ошибки
+QUERY_BUDGET_STRICT = False
+
 # Обработка ошибок
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Двухуровневый кэш: L1 в памяти воркера перед общим L2.
+# По умолчанию L2 - файловый кэш, общий для всех воркеров на сервере;
+# для нескольких серверов задайте CACHE_BACKEND, например memcached
+# (django.core.cache.backends.memcached.MemcachedCache) или кэш в БД
+# (django.core.cache.backends.db.DatabaseCache + createcachetable).
+# LocMemCache в роли L2 у каждого процесса свой: инвалидации и лимиты
+# частоты запросов не будут общими.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        # Имя L1, общего для всех потоков процесса
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'L2_ALIAS': 'shared',
+            'L1_MAX_ENTRIES': int(os.getenv('CACHE_L1_MAX_ENTRIES', 1000)),
+            'L1_TIMEOUT': int(os.getenv('CACHE_L1_TIMEOUT', 60)),
+            'GENERATION_CHECK_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'core.cache_backends.FileBasedCache',
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'yatube_cache'),
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
 }